@@ -14,6 +14,10 @@ To-do
 """
 import os
 import sys
+import time
+import tempfile
+from concurrent.futures import wait, CancelledError, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '_lib'))
 try:
     from PyQt5 import QtCore, QtWidgets, uic, QtGui
@@ -27,9 +31,12 @@ except ModuleNotFoundError as error:
         print('\n'+error.msg+'\nPlease use PIP to install\n')
     raise
     
-from _lib.ReelMisc import tth2Q, Q2tth, Q2d, tth2d, scaleArray, gridInterpolation, generateTicks
+from _lib.ReelMisc import tth2Q, Q2tth, Q2d, tth2d, scaleArray, generateTicks, findNewFiles, fileStats, chunkRows, LRUCache, decimationPyramid, allocate, appendFrames
 from _lib.ReelPlotWidgets import MultiImageWidget, PlotPatternWidget, PlotSliceWidget, PlotParametersWidget
-from _lib.ReelRead import readCSV, readPRF, readPrfAlt, readXYY, readDAT, readXYE, readFIT, readPAR
+from _lib.ReelRead import readCSV, readPrfAny, readXYY, readDAT, readXYE, indexPAR, readParDataset, submitParDataset, readFiles, submitFiles, getWorkers, shutdownExecutor
+from _lib.ReelCache import cacheKey, readCache, writeCache
+from _lib.ReelLoader import LoadThread, NoProgress
+from _lib.ReelDataset import Dataset, PatternStatistics, placeholder, isPlaceholder, isAbsent, spliceFrames
 
 from _lib.guipalettes import darkPalette
 import ReelUserSettings as us
@@ -51,6 +58,8 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         
         self.actionToggle_Q.triggered.connect(self.toggleQ)
         
+        self.actionWatch_folder.toggled.connect(self.setWatchFolder)
+        
         self.actionOpen_files.triggered.connect(self.openFiles)
         self.actionOpen_files_2.triggered.connect(self.openFiles) # toolbar
         
@@ -88,8 +97,8 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         self.verticalLayout_sli.insertWidget(0, self.psw)
         self.verticalLayout_par.insertWidget(0, self.parw)
         
-        self.miw.sigHLineDragged.connect(self.updatePatternPlot)
-        self.miw.sigVLineDragged.connect(self.updateSlicePlot)
+        self.miw.sigHLineDragged.connect(lambda: self.scheduleCursorUpdate(self.updatePatternPlot,0))
+        self.miw.sigVLineDragged.connect(lambda: self.scheduleCursorUpdate(self.updateSlicePlot,1))
         self.miw.sigDoubleClicked.connect(self.updateCrosshair)
         self.parw.sigVLineDragged.connect(self.updateHLine)
         for image in self.miw.images:
@@ -100,18 +109,45 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         
         self.datasets = ['']
         self.dataset_index = 0
-        self.im = [np.zeros((3,100,100))]
-        self.tth = [np.arange(0,100,1)]
-        self.files = [['']]
-        self.par_file = [['']]
-        self.lambd = [None]
-        self.sub_plots = [{}]
-        self.bgr = [[]]
-        self.param = [{}]
-        self.dev_from_mean = [False]  # use deviation from mean instead of calculated and residual
+        self.data = [Dataset()] # one Dataset for each toolbar action in self.datasets
         
         self.control_is_pressed = False
         
+        self.cache_directory = us.cache_directory
+        if not self.cache_directory:
+            self.cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)),'_cache')
+        self.store_directory = us.out_of_core_directory or None # folder for memory-mapped datasets, see allocate
+        self.display_cache = LRUCache(us.display_cache_size*1e6) # surface images, see displayImage
+        self.spill_directory = self.store_directory or tempfile.gettempdir() # folder for datasets moved out of memory, see manageMemory
+        self.viewed = [] # datasets in the order they were last shown
+        
+        self.cursor_updates = {} # plot updates waiting for the cursor timer, see scheduleCursorUpdate
+        self.cursor_updated = 0.0 # time of the last cursor update
+        self.frame_interval = 1/max(1,QtWidgets.QApplication.primaryScreen().refreshRate()) # seconds per display frame
+        self.cursor_timer = QtCore.QTimer(self)
+        self.cursor_timer.setSingleShot(True)
+        self.cursor_timer.timeout.connect(self.runCursorUpdates)
+        
+        self.watch = None # state of the watched dataset
+        self.watch_timer = QtCore.QTimer(self)
+        self.watch_timer.setInterval(us.watch_interval)
+        self.watch_timer.timeout.connect(self.pollWatchedFolder)
+        
+        self.loader = None # thread reading files in the background
+        self.load_finished = None # called with the return value of the loader
+        self.load_partial = None # called with the frames read so far, or None
+        self.load_queue = [] # (function, args, finished, label) waiting for the loader
+        self.loadLabel = QtWidgets.QLabel('')
+        self.loadBar = QtWidgets.QProgressBar()
+        self.loadBar.setMaximumWidth(200)
+        self.loadCancel = QtWidgets.QPushButton('Cancel')
+        self.loadCancel.clicked.connect(self.cancelLoading)
+        for widget in (self.loadLabel,self.loadBar,self.loadCancel):
+            self.statusbar.addPermanentWidget(widget)
+            widget.hide()
+        self.memoryLabel = QtWidgets.QLabel('')
+        self.statusbar.addPermanentWidget(self.memoryLabel)
+        
         self.plotLogo()
         self.scale_surf = us.default_surface_scale
         self.scale_pat = us.default_pattern_scale
@@ -120,6 +156,16 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         if '-debug' in sys.argv:
             self.openTestfiles()
 
+    def closeEvent(self, event):
+        # stop the loader thread before the window is destroyed
+        self.load_queue = []
+        if not self.loader is None:
+            self.loader.cancel()
+            self.loader.wait()
+        # queued .par datasets would otherwise be regridded before the interpreter can exit
+        shutdownExecutor()
+        event.accept()
+
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
             event.accept()
@@ -214,34 +260,51 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         if self.actionNext.isEnabled():
             index = self.dataset_index
             index +=1
-            index %=len(self.im) # wrap index
+            index %=len(self.data) # wrap index
             self.datasets[index].trigger()
         
     def previousDataset(self):
         if self.actionPrevious.isEnabled():
             index = self.dataset_index
             index -=1
-            index %=len(self.im) # wrap index
+            index %=len(self.data) # wrap index
             self.datasets[index].trigger()
     
     def moveReelCursor(self,increment=0):
         index = self.dataset_index
-        im = self.im[index]
+        im = self.data[index].im
         h_pos = self.miw.getHorizontalLineVal()
         h_pos = np.floor(h_pos)+increment
-        h_pos = np.clip(h_pos,0,im.shape[2]-1)
+        h_pos = np.clip(h_pos,0,im[0].shape[0]-1)
         [self.miw.hlines[i].setValue(h_pos) for i in range(3)]
         #self.parw.updateVline(h_pos)
-        self.updatePatternPlot(0)
+        self.scheduleCursorUpdate(self.updatePatternPlot,0)
     
     def moveSliceCursor(self,increment=0):
         index = self.dataset_index
-        im = self.im[index]
+        im = self.data[index].im
         v_pos = self.miw.getVerticalLineVal()
         v_pos = np.floor(v_pos)+increment
-        v_pos = np.clip(v_pos,0,im.shape[1]-1)
+        v_pos = np.clip(v_pos,0,im[0].shape[1]-1)
         [self.miw.vlines[i].setValue(v_pos+0.5) for i in range(3)]
-        self.updateSlicePlot(1)
+        self.scheduleCursorUpdate(self.updateSlicePlot,1)
+    
+    def scheduleCursorUpdate(self,update,index):
+        """
+        Run update(index) for the latest cursor position at most once per display frame.
+        Dragging the cursors or holding the arrow keys moves them far more often than the plots can be redrawn,
+        so the moves are coalesced instead of queued
+        """
+        self.cursor_updates[update] = index
+        if not self.cursor_timer.isActive():
+            wait = self.cursor_updated+self.frame_interval-time.perf_counter()
+            self.cursor_timer.start(max(0,int(wait*1000)))
+    
+    def runCursorUpdates(self):
+        updates, self.cursor_updates = self.cursor_updates, {}
+        self.cursor_updated = time.perf_counter()
+        for update, index in updates.items():
+            update(index)
     
     def updateCrosshair(self):
         """update pattern and slice plot from new reel cursor crosshair position"""
@@ -251,7 +314,7 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
     
     def showCurrentWavelength(self):
         index = self.dataset_index
-        lambd = self.lambd[index]
+        lambd = self.data[index].lambd
         if isinstance(lambd,float):
             s = 'Wavelength: {:.4f}'.format(lambd)
         else:
@@ -260,7 +323,7 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         self.actionSet_wavelength_2.setStatusTip(s)
     
     def setSurfaceplotLabels(self,index):
-        if self.dev_from_mean[index]:
+        if self.data[index].dev_from_mean:
             self.miw.setLabel(2,'Mean')
             self.miw.setLabel(4,'Deviation from mean')
             self.ppw.setCalLabel('Mean')
@@ -272,13 +335,17 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             self.ppw.setResLabel('Residual')
     
     def changeDataset(self,index):
-        tth = self.tth[index]
-        im = self.im[index]
+        """Show the dataset at index - return False if reading a .par dataset was canceled, leaving the view unchanged"""
+        if not self.data[index].par_pending is None and not self.loadParDataset(index):
+            return False
+        self.manageMemory()
+        tth = self.data[index].tth
+        im = self.data[index].im
         h_pos = round(self.miw.getHorizontalLineVal(),2)
         v_pos = round(self.miw.getVerticalLineVal(),2)
         scale = self.miw.getScale()
         vrect = self.miw.getViewRect()
-        lambd = self.lambd[index]
+        lambd = self.data[index].lambd
         if self.actionToggle_Q.isChecked() and isinstance(lambd,type(None)):
             self.setManualWavelength()
         self.setSurfaceplotLabels(index)
@@ -293,38 +360,26 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         self.miw.setViewRange(vrect)
         self.parw.updateVline(h_pos+0.5)
         self.showCurrentWavelength()
-        
+        return True
     
     def addDataset(self,is_par=False,files=None,ext=None):
-        self.im.append(np.zeros((3,100,100)))
-        self.tth.append(np.arange(0,100,1))
-        self.files.append([''])
-        self.par_file.append([''])
-        self.lambd.append(None)
-        self.dev_from_mean.append(False)
-        self.sub_plots.append({})
-        self.bgr.append([])
-        self.param.append({})
-        self.datasets.append('')
-        self.dataset_index = len(self.im)-1
-        
         if is_par != True:
-            self.openFiles(files,ext)
+            # the dataset is added when the files have been read, see getLoadTarget
+            self.openFiles(files,ext,add=True)
+            return
+        self.data.append(Dataset())
+        self.datasets.append('')
+        self.dataset_index = len(self.data)-1
     
     def removeDataset(self):
-        if len(self.im)==1:
+        if len(self.data)==1:
             self.removeAllDatasets()
             return
         index = self.dataset_index # get target index
-        self.im.pop(index)
-        self.tth.pop(index)
-        self.files.pop(index)
-        self.par_file.pop(index)
-        self.lambd.pop(index)
-        self.dev_from_mean.pop(index)
-        self.sub_plots.pop(index)
-        self.bgr.pop(index)
-        self.param.pop(index)
+        dataset = self.data.pop(index)
+        self.cancelParPending([dataset.par_pending])
+        self.display_cache.discard(lambda key: key[0] is dataset)
+        dataset.release()
         ac = self.datasets.pop(index)
         self.removeToolbarAction(ac)
         self.previousDataset()
@@ -332,19 +387,15 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
     def removeAllDatasets(self):
         path = self.path
         self.dataset_index = 0
-        self.im = [np.zeros((3,100,100))]
-        self.tth = [np.arange(0,100,1)]
-        self.files = [['']]
-        self.par_file = [['']]
-        self.lambd = [None]
-        self.dev_from_mean = [False]
-        self.sub_plots=[{}]
-        self.bgr= [[]]
-        self.param = [{}]
+        self.cancelParPending([dataset.par_pending for dataset in self.data])
+        self.display_cache.discard()
+        [dataset.release() for dataset in self.data]
+        self.data = [Dataset()]
         self.plotLogo()
         [self.removeToolbarAction(ac) for ac in self.datasets]
         self.datasets=['']
         self.enableActions(False)
+        self.manageMemory()
         self.path = path
         
     def plotLogo(self):
@@ -382,8 +433,17 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             index = self.dataset_index
             self.datasets[index].setChecked(True)
         else:
+            previous = self.dataset_index
             self.dataset_index = index
-            self.changeDataset(index)
+            if not self.changeDataset(index):
+                # reading the dataset was canceled - show the previous dataset, or the first one read if it was removed
+                loaded = [i for i, dataset in enumerate(self.data) if dataset.par_pending is None]
+                if len(loaded)<1:
+                    self.removeAllDatasets()
+                    return
+                self.dataset_index = previous if previous in loaded else loaded[0]
+                [ac.setChecked(i==self.dataset_index) for i, ac in enumerate(self.datasets) if isinstance(ac,QtWidgets.QAction)]
+                self.changeDataset(self.dataset_index)
     
     def restoreDefaultSettings(self):
         yes = QtWidgets.QMessageBox.Yes
@@ -410,25 +470,24 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             self.statusbar.clearMessage()
             return
         index = self.dataset_index
-        im = self.im[index]
-        datapoints  = im.shape[1]
-        frames = im.shape[2]
-        pos = event.pos()
+        im = self.data[index].im
+        frames, datapoints = im[0].shape
+        pos = self.miw.views[0].mapSceneToView(event.scenePos()) # the images may be scaled and cropped, see MultiImageWidget.setData
         i, j = pos.x(), pos.y()
         i = int(np.clip(i, 0, datapoints - 1))
-        j = int(np.clip(j, 0, frames - 1))
-        tth = self.tth[index][i]
-        obs, calc, res = [val[i, frames-(j+1)] for val in im]
-        lambd = self.lambd[index]
+        j = int(np.clip(np.floor(j-0.5), 0, frames - 1)) # frames are drawn half a row up, see MultiImageWidget.setData
+        tth = self.data[index].tth[i]
+        obs, calc, res = [val[j, i] for val in im]
+        lambd = self.data[index].lambd
         if isinstance(lambd,float):
             Q = tth2Q(tth,lambd)
             d = tth2d(tth,lambd)
-            if self.dev_from_mean[index]:
+            if self.data[index].dev_from_mean:
                 self.statusbar.showMessage('Pattern: {:4d}  |  2θ: {:6.2f} °  |  Q: {:6.3f} Å⁻¹ |  d: {:6.3f} Å  |  Observed: {:8.1f}  |  Mean: {:8.1f}  |  Deviation from mean: {:8.1f} % |'.format(j+1,tth,Q,d,obs,calc,res))
             else:
                 self.statusbar.showMessage('Pattern: {:4d}  |  2θ: {:6.2f} °  |  Q: {:6.3f} Å⁻¹ |  d: {:6.3f} Å  |  Observed: {:8.1f}  |  Calculated: {:8.1f}  |  Residual: {:8.1f}  |'.format(j+1,tth,Q,d,obs,calc,res))
         else:
-            if self.dev_from_mean[index]:
+            if self.data[index].dev_from_mean:
                 self.statusbar.showMessage('Pattern: {:4d}  |  2θ: {:6.2f} °  |  Observed: {:8.1f}  |  Mean: {:8.1f}  |  Deviation from mean: {:8.1f} % |'.format(j+1,tth,obs,calc,res))
             else:
                 self.statusbar.showMessage('Pattern: {:4d}  |  2θ: {:6.2f} °  |  Observed: {:8.1f}  |  Calculated: {:8.1f}  |  Residual: {:8.1f}  |'.format(j+1,tth,obs,calc,res))
@@ -445,7 +504,7 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         pos = event.pos()
         vpos = self.ppw.pobs.getViewBox().mapToView(pos)
         x, I = vpos.x(), vpos.y()
-        lambd = self.lambd[index]
+        lambd = self.data[index].lambd
         if self.actionToggle_Q.isChecked() and isinstance(lambd,float):
             Q = x
             tth = Q2tth(x,lambd)
@@ -481,22 +540,199 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
  
     def updateFiles(self):
         index = self.dataset_index
-        files = self.files[index]
-        if files[0].endswith('.prf'):
-            ext='*.prf'
-        elif files[0].endswith('.xyy'):
-            ext='*.xyy'
-        elif files[0].endswith('.dat'):
-            ext='*.dat'
-        elif files[0].endswith('.xye') or files[0].endswith('.xy'):
-            ext='*.xye *.xy'
-        elif files[0].endswith('.par'):
-            files = self.par_file[index]
-            ext='*.par'
-        elif files[0].endswith('.csv'):
+        files = self.data[index].files
+        ext = self.getFileExtension(files[0])
+        if ext=='*.par':
+            files = self.data[index].par_file
+        elif ext=='*.csv':
             self.openFiles(files=None,ext='*.csv')
             return
-        self.openFiles(files=files,ext=ext)
+        if ext=='*.par' or not self.updateDataset(files,ext):
+            self.openFiles(files=files,ext=ext)
+    
+    def getFileExtension(self,fname):
+        """Return the file filter matching fname, or None if the format is not supported"""
+        for ext in ('*.prf','*.xyy','*.dat','*.xye *.xy','*.par','*.csv'):
+            if fname.endswith(tuple(e[1:] for e in ext.split())):
+                return ext
+        return None
+    
+    def getReadMethod(self,ext):
+        """Return the open* method and the reader used for a series of files with the extension ext"""
+        return {'*.xyy':(self.openXYY,readXYY),
+                '*.prf':(self.openPRF,readPrfAny),
+                '*.dat':(self.openDAT,readDAT)}.get(ext,(self.openXYE,readXYE))
+    
+    def updateDataset(self,files,ext):
+        """
+        Re-read modified files and append new files in the folder to the current dataset in the loader thread.
+        Return False if the dataset has to be reloaded from scratch instead.
+        """
+        index = self.dataset_index
+        stats = fileStats(files)
+        if None in stats or len(stats) != len(self.data[index].file_stats):
+            return False
+        changed = [i for i, st in enumerate(stats) if st != self.data[index].file_stats[i]]
+        new = findNewFiles(files)
+        if len(changed)+len(new) < 1:
+            self.statusbar.showMessage('No new or modified files',5000)
+            return True
+        read, _ = self.getReadMethod(ext)
+        sub = [files[i] for i in changed]+new
+        sub_stats = fileStats(sub)
+        target = self.datasets[index]
+        self.startLoading(read,(sub,),
+                          lambda result: self.spliceUpdate(target,files,ext,changed,new,stats+sub_stats[len(changed):],result),
+                          'Updating {}'.format(os.path.basename(os.path.dirname(files[0]))))
+        return True
+    
+    def spliceUpdate(self,target,files,ext,changed,new,stats,result):
+        """Splice the files read by updateDataset into the dataset of the toolbar action target - reload the dataset if they do not fit"""
+        if result[-1] or not target in self.datasets: # was_canceled or removed
+            return
+        if not self.spliceDataset(self.datasets.index(target),changed,new,stats,result):
+            self.loadFiles(files,ext,target)
+            return
+        self.statusbar.showMessage('Updated {} modified and {} new files'.format(len(changed),len(new)),5000)
+    
+    def spliceDataset(self,index,changed,new,stats,result,incremental=False):
+        """
+        Replace the changed frames of dataset index and append the new files from the output of an open* method.
+        incremental is True while files are appended to a watched folder - the appended frames are then compared to
+        the mean of the previous frames, until the number of frames doubles or watching stops (see setWatchFolder).
+        Return False if the frames do not fit the dataset.
+        """
+        im_s, _, _, _, param_s, sub_plots_s, bgr_s, statistics_s, _, _ = result
+        dataset = self.data[index]
+        im, bgr = dataset.im, dataset.bgr
+        param, sub_plots = dataset.param, dataset.sub_plots
+        if im_s[0].shape[1] != im[0].shape[1] or set(param_s) != set(param) or set(sub_plots_s) != set(sub_plots):
+            return False
+        
+        # the arrays grow in place (see appendFrames), so appending to a series of N frames costs O(N) in total
+        n = len(changed)
+        frames = im[0].shape[0]
+        statistics = dataset.statistics.splice(changed,statistics_s,im[0][changed])
+        # the mean and deviation from mean are computed again from the observed frames
+        channels = 1 if dataset.dev_from_mean else 3
+        im[:channels] = [spliceFrames(im[i],changed,im_s[i],self.store_directory) for i in range(channels)]
+        bgr = spliceFrames(bgr,changed,bgr_s,self.store_directory)
+        for key in sub_plots:
+            sub_plots[key] = spliceFrames(sub_plots[key],changed,sub_plots_s[key],self.store_directory)
+        for key in param:
+            param[key] = spliceFrames(param[key],changed,param_s[key])
+        appended = n<1 and frames>0
+        if dataset.dev_from_mean:
+            appended = appended and incremental and im[0].shape[0].bit_length() == frames.bit_length() and im[2].shape[0] == frames
+            self.setDeviationFromMean(im,statistics,start=frames if appended else 0)
+        
+        dataset.im = im
+        dataset.bgr = bgr
+        dataset.statistics = statistics
+        dataset.modified(frames if appended else None)
+        dataset.files = dataset.files+new
+        dataset.file_stats = stats
+        if index == self.dataset_index:
+            self.changeDataset(index)
+        return True
+    
+    def setWatchFolder(self,checked):
+        """Start or stop watching the folder of the current dataset for new files"""
+        self.watch_timer.stop()
+        watch, self.watch = self.watch, None
+        if not watch is None and watch['action'] in self.datasets:
+            # appended frames were compared to the mean of the previous frames, see spliceDataset
+            index = self.datasets.index(watch['action'])
+            dataset = self.data[index]
+            if dataset.dev_from_mean and not dataset.statistics is None:
+                self.setDeviationFromMean(dataset.im,dataset.statistics)
+                dataset.modified()
+                if index == self.dataset_index:
+                    self.changeDataset(index)
+        if not checked:
+            return
+        index = self.dataset_index
+        ext = self.getFileExtension(self.data[index].files[0])
+        if ext in (None,'*.par','*.csv'):
+            self.statusbar.showMessage('Only series of .xyy, .prf, .dat, .xye or .xy files can be watched',5000)
+            self.actionWatch_folder.setChecked(False)
+            return
+        self.watch = {'action':self.datasets[index], # identifies the dataset while others are added or removed
+                      'ext':ext,
+                      'sizes':{},   # size of new files at the previous check
+                      'failed':{},  # number of failed attempts to read each file
+                      'futures':[],
+                      'files':[]}
+        self.watch_timer.start()
+        self.statusbar.showMessage('Watching {}'.format(os.path.dirname(self.data[index].files[0])),5000)
+    
+    def pollWatchedFolder(self):
+        """Read new files in the watched folder in the background and append them to the watched dataset"""
+        watch = self.watch
+        if watch is None:
+            return
+        if not watch['action'] in self.datasets:
+            # the watched dataset has been removed or replaced
+            self.actionWatch_folder.setChecked(False)
+            return
+        index = self.datasets.index(watch['action'])
+        if len(watch['futures'])>0:
+            if not all(future.done() for future in watch['futures']):
+                return
+            self.appendWatchedFiles(index)
+            if not self.watch is watch:
+                return
+        # only read files of non-zero size that are no longer being written,
+        # i.e. did not grow since the previous check or were last modified before it
+        ready, sizes = [], {}
+        t = time.time()-us.watch_interval/1000
+        for f in findNewFiles(self.data[index].files):
+            if watch['failed'].get(f,0) >= 3:
+                continue
+            try:
+                st = os.stat(f)
+            except OSError:
+                break
+            sizes[f] = st.st_size
+            if st.st_size < 1 or (st.st_size != watch['sizes'].get(f) and st.st_mtime > t):
+                break
+            ready.append(f)
+        watch['sizes'] = sizes
+        if len(ready)>0:
+            _, reader = self.getReadMethod(watch['ext'])
+            watch['files'] = ready
+            watch['futures'] = [submitFiles(reader,[f],us.loader_workers) for f in ready]
+    
+    def appendWatchedFiles(self,index):
+        """Append the files read by pollWatchedFolder to dataset index, up to the first file that failed"""
+        watch = self.watch
+        files, futures = watch['files'], watch['futures']
+        watch['files'], watch['futures'] = [], []
+        results = []
+        for f, future in zip(files,futures):
+            try:
+                results += future.result()
+            except Exception as error:
+                watch['failed'][f] = watch['failed'].get(f,0)+1
+                self.statusbar.showMessage('Unable to read {}: {}'.format(os.path.basename(f),error),5000)
+                break
+        if len(results)<1:
+            return
+        files = files[:len(results)]
+        stats = fileStats(files)
+        if None in stats:
+            return
+        read, _ = self.getReadMethod(watch['ext'])
+        result = read(files,results=results,progress=NoProgress())
+        if not self.spliceDataset(index,[],files,self.data[index].file_stats+stats,result,incremental=True):
+            self.statusbar.showMessage('New files do not match the watched dataset',5000)
+            self.actionWatch_folder.setChecked(False)
+            return
+        if index == self.dataset_index and self.actionFollow_newest.isChecked():
+            h_pos = self.data[index].im[0].shape[0]
+            [self.miw.hlines[i].setValue(h_pos) for i in range(3)]
+            self.updatePatternPlot(self.tabWidget_pattern.currentIndex())
+        self.statusbar.showMessage('Added {} new files'.format(len(files)),5000)
     
     def aboutBox(self):
         about = ['<html>',
@@ -513,9 +749,69 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
                 '</html>']
         QtWidgets.QMessageBox.about(self,'About',''.join(about))
     
+    def displayImage(self,dataset,i,step,subtract_bgr,scale):
+        """
+        Return the image of channel i of dataset drawn in the surface plots, the number of frames it is stretched over and its decimation pyramid.
+        The image is every step'th frame, background subtracted and scaled - each stage is kept in the display cache,
+        so switching back to a scale, background subtraction or dataset does not compute it again.
+        If frames were only appended to dataset since the stages were cached, only the appended frames are computed and appended to them
+        """
+        appended = dataset.appended
+        self.display_cache.discard(lambda key: key[0] is dataset and key[1] != dataset.revision and not (appended and key[1] == appended[0]))
+        im, bgr = dataset.im[i], dataset.bgr
+        frames = im.shape[0]
+        a, b, rows = im[::step], bgr[::step], -(-frames//step)*step
+        if isPlaceholder(a) and (not subtract_bgr or isPlaceholder(bgr)):
+            # the same for all frames - draw a single frame stretched over all of them
+            a, b, rows = a[:1], bgr[:1], frames
+            appended = None
+        key = (dataset,dataset.revision,i,rows,a.shape[0])
+        if appended:
+            n = -(-appended[1]//step)
+            old_key = (dataset,appended[0],i,n*step,n)
+        def stage(key,a,compute):
+            # the cached stage of the frames before the append, extended by the appended frames
+            old = self.display_cache.pop(old_key+key[5:]) if appended else None
+            if old is None or old.shape[0] != n or np.may_share_memory(old,im):
+                return self.display_cache.get(key,lambda: compute(a))
+            return self.display_cache.get(key,lambda: appendFrames(old,compute(a[n:])))
+        if subtract_bgr:
+            key += ('subtract background',)
+            a = stage(key,a,lambda a, b=b: a-b[-a.shape[0]:])
+        if scale != 'linear':
+            key += (scale,)
+            a = stage(key,a,lambda a: scaleArray(a,scale,retain_sign=i==2))
+        old = self.display_cache.pop(old_key+key[5:]+('pyramid',)) if appended else None
+        levels = self.display_cache.get(key+('pyramid',),lambda: decimationPyramid(a,previous=None if old is None else [a[:n]]+old)[1:],
+                                        size=lambda levels: sum(l.nbytes for l in levels))
+        return a, rows, levels
+    
+    def manageMemory(self):
+        """
+        Keep the patterns of the open datasets within us.memory_budget, by moving the least recently shown datasets
+        to memory-mapped files (see Dataset.spill). The shown dataset is read back into memory, and the memory in use is shown
+        """
+        dataset = self.data[self.dataset_index]
+        dataset.restore()
+        self.viewed = [d for d in self.viewed if d in self.data and not d is dataset]+[dataset]
+        held = sum(d.nbytes() for d in self.data)
+        if us.memory_budget:
+            # datasets that were never shown first, then the least recently shown
+            for d in [d for d in self.data if not d in self.viewed]+self.viewed[:-1]:
+                if held <= us.memory_budget*1e6:
+                    break
+                if d.loading:
+                    continue
+                held -= d.nbytes()
+                d.spill(self.spill_directory)
+                held += d.nbytes()
+        self.memoryLabel.setText('Memory: {:.0f} MB'.format((held+self.display_cache.size)/1e6))
+        self.memoryLabel.setToolTip('Datasets: {:.0f} MB{}\nSurface images and plots: {:.0f} MB'.format(
+            held/1e6,' of {:.0f} MB'.format(us.memory_budget) if us.memory_budget else '',self.display_cache.size/1e6))
+    
     def setManualWavelength(self):
         index = self.dataset_index
-        l = self.lambd
+        l = [dataset.lambd for dataset in self.data]
         for i in range(len(l)):
             lambd = l[(index+i)%len(l)]
             if isinstance(lambd,float):
@@ -530,21 +826,21 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
                                                      10,                           # maxValue
                                                      4)                            # decimals
         if ok:
-            self.lambd[index] = value
+            self.data[index].lambd = value
             self.showCurrentWavelength()
         return ok
     
     def toggleQ(self):
         index = self.dataset_index
-        x = self.tth[index]
-        lambd = self.lambd[index]
+        x = self.data[index].tth
+        lambd = self.data[index].lambd
         if self.actionToggle_Q.isChecked():
             self.miw.setXLabel('Q (Å<sup>-1</sup>)')
             if isinstance(lambd,float):
                 x = tth2Q(x,lambd)
             else:
                 if self.setManualWavelength():
-                    lambd = self.lambd[index]
+                    lambd = self.data[index].lambd
                     x = tth2Q(x,lambd)
                 else:
                     self.actionToggle_Q.setChecked(False)
@@ -564,13 +860,13 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         self.tabWidget_pattern.setCurrentIndex(index)
         h_val = self.miw.getHorizontalLineVal()
         index = self.dataset_index
-        im = self.im[index]
-        files = self.files[index]
+        im = self.data[index].im
+        files = self.data[index].files
         pos = np.round(h_val)-1
-        pos = int(np.clip(pos,0,im.shape[2]-1))
+        pos = int(np.clip(pos,0,im[0].shape[0]-1))
         temp = ''
         if not files[0] == '':
-            param = self.param[index]
+            param = self.data[index].param
             for key in param:
                 if key=='Temperature (°C)':
                     temp = ' - Temperature: {:.0f} °C'.format(param[key][(pos)])
@@ -580,12 +876,12 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             title = '{}{}'.format(fname,temp)
             self.ppw.setTitle(title)
         scale = self.scale_pat
-        obs, calc, res = [im[i,:,-(pos+1)] for i in range(3)]
+        obs, calc, res = [im[i][pos] for i in range(3)]
         if self.subtract_bgr_pat:
-            bgr = self.bgr[index][:,-(pos+1)]
+            bgr = self.data[index].bgr[pos]
             obs, calc, = obs-bgr, calc-bgr
-        x = self.tth[index]
-        lambd = self.lambd[index]
+        x = self.data[index].tth
+        lambd = self.data[index].lambd
         if self.actionToggle_Q.isChecked() and isinstance(lambd,float):
             x = tth2Q(x, lambd)
             self.ppw.setLabel('bottom','Q (Å<sup>-1</sup>)')
@@ -594,7 +890,7 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         self.ppw.setObsData(x,scaleArray(obs,scale))
         self.ppw.setCalData(x,scaleArray(calc,scale))
         self.ppw.setResData(x,scaleArray(res,scale,retain_sign=True))
-        sub_plots = self.sub_plots[index]
+        sub_plots = self.data[index].sub_plots
         active = self.getSubplotActions()
         for key in active:
             y = sub_plots[key][(pos),:]
@@ -610,11 +906,11 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         self.tabWidget_pattern.setCurrentIndex(index)
         v_val = self.miw.getVerticalLineVal()
         index = self.dataset_index
-        im = self.im[index]
-        pos = int(np.clip(np.floor(v_val),0,im.shape[1]-1))
-        tth = self.tth[index]
+        im = self.data[index].im
+        pos = int(np.clip(np.floor(v_val),0,im[0].shape[1]-1))
+        tth = self.data[index].tth
         tth = tth[pos]
-        lambd = self.lambd[index]
+        lambd = self.data[index].lambd
         if isinstance(lambd,float):
             Q = tth2Q(tth,lambd)
             d = tth2d(tth,lambd)
@@ -624,68 +920,65 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         self.psw.setTitle(titel)
         # Slice integration interval
         intvl = us.default_slice_integration_interval
-        coord = np.clip([pos+intvl[0],pos+intvl[1]+1],0,im.shape[1])
+        coord = np.clip([pos+intvl[0],pos+intvl[1]+1],0,im[0].shape[1])
         scale = self.scale_pat
         
-        x = np.arange(0,im.shape[2],1,dtype='float32')
-        ocr = [np.flip(im[i,coord[0]:coord[1],:],axis=1) for i in range(3)] # obs, calc, res
-        excl = [np.all(np.isnan(y),axis=0) for y in ocr]
-        obs, calc, res = [np.nanmean(y[:,~excl[i]],axis=0) for i,y in enumerate(ocr)]
+        x = np.arange(0,im[0].shape[0],1,dtype='float32')
+        ocr = [im[i][:,coord[0]:coord[1]] for i in range(3)] # obs, calc, res
+        excl = [np.all(np.isnan(y),axis=1) for y in ocr]
+        obs, calc, res = [np.nanmean(y[~excl[i]],axis=1) for i,y in enumerate(ocr)]
         if self.subtract_bgr_pat:
-            bgr = np.flip(self.bgr[index][coord[0]:coord[1],:],axis=1)
-            obs, calc = [y-np.nanmean(bgr[:,~excl[i]],axis=0) for i,y in enumerate((obs, calc))] 
+            bgr = self.data[index].bgr[:,coord[0]:coord[1]]
+            obs, calc = [y-np.nanmean(bgr[~excl[i]],axis=1) for i,y in enumerate((obs, calc))] 
  
         self.psw.setObsData(x[~excl[0]],scaleArray(obs,scale))
         self.psw.setCalData(x[~excl[1]],scaleArray(calc,scale))
         self.psw.setResData(x[~excl[2]],scaleArray(res,scale,retain_sign=True))
         
-        sub_plots = self.sub_plots[index]
+        sub_plots = self.data[index].sub_plots
         active = self.getSubplotActions()
         for key in active:
             y = np.nanmean(sub_plots[key][:,coord[0]:coord[1]][~excl[1],:],axis=1)
             if self.subtract_bgr_pat:
-                y = y-np.nanmean(bgr[:,~excl[1]],axis=0)
+                y = y-np.nanmean(bgr[~excl[1]],axis=1)
             self.psw.setSubplotData(key,x[~excl[1]],scaleArray(y,scale))
             
             
     def initParameterPlot(self):
-        self.parw.removePrimaryPlots()
-        self.parw.removeSecondaryPlots()
-        primary = self.getPrimaryParam()
-        secondary = self.getSecondaryParam()
-        for key in primary:
-            self.parw.addPrimaryPlot(key)
-        for key in secondary:
-            self.parw.addSecondaryPlot(key)
-        self.updateParameterPlot()
-
-        
-    def updateParameterPlot(self):
         index = self.dataset_index
-        im = self.im[index]
-        x = np.arange(1,im.shape[2]+1,1,dtype='float32')
-        self.parw.clearPlot()
+        dataset = self.data[index]
         primary = self.getPrimaryParam()
         secondary = self.getSecondaryParam()
-        param = self.param[index]
-        for key in param:
+        plots = ({},{})
+        for key in dataset.param:
             if key in primary:
-                self.parw.setPrimaryData(key,x,param[key])
+                plots[0][key] = self.parameterPlot(dataset,key)
             elif key in secondary:
-                self.parw.setSecondaryData(key,x,param[key]) 
+                plots[1][key] = self.parameterPlot(dataset,key,secondary=True)
+        self.parw.setPlots(*plots)
+    
+    def parameterPlot(self,dataset,key,secondary=False):
+        """Return the plot of parameter key of dataset - kept in the display cache, so switching back to the dataset does not plot it again"""
+        def plot():
+            y = dataset.param[key]
+            x = np.arange(1,y.shape[0]+1,1,dtype='float32')
+            return self.parw.makePlot(key,x,y,secondary)
+        # the symbols are drawn from a record per point
+        size = lambda p: p.xData.nbytes+p.yData.nbytes+p.scatter.data.nbytes
+        return self.display_cache.get((dataset,dataset.revision,'parameter',key,secondary),plot,size)
         
     def setParameterActions(self):
         index = self.dataset_index
         old_primary = self.getPrimaryParam()
         old_secondary = self.getSecondaryParam()
-        params = self.param[index]
+        params = self.data[index].param
         if len(old_primary)<2 and len(params)>1:
             old_primary = us.default_primary_parameter_plot
         if len(old_secondary)<2 and len(params)>1:
             old_secondary = us.default_secondary_parameter_plot
         self.menuPrimary_axis.clear()
         self.menuSecondary_axis.clear()
-        #param_actions = [QtWidgets.QAction(param) for param in self.param]
+        #param_actions = [QtWidgets.QAction(param) for param in self.data[index].param]
         menu = self.menuPrimary_axis
         param_actions = [menu.addAction(param) for param in params]
         for action in param_actions:
@@ -701,7 +994,7 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             ac.setEnabled(False)
             
         menu = self.menuSecondary_axis
-        param_actions = [menu.addAction(param) for param in self.param[index]]
+        param_actions = [menu.addAction(param) for param in self.data[index].param]
         for action in param_actions:
             action.setCheckable(True)
             action.triggered.connect(self.initParameterPlot)
@@ -728,7 +1021,7 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         if len(old)<1:
             old = us.default_sub_plots
         menu.clear()
-        subplot_actions = [menu.addAction(sub) for sub in self.sub_plots[index]]
+        subplot_actions = [menu.addAction(sub) for sub in self.data[index].sub_plots]
         for action in subplot_actions:
             action.setCheckable(True)
             action.triggered.connect(self.updateSubplots)
@@ -753,10 +1046,14 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             
     def setMultiImages(self,tth,im):
         index = self.dataset_index
-        im = im.astype(dtype='float32')
-        im = np.rot90(im,k=1,axes=(1,2))
+        # the images are the dataset itself - only scaling or background subtraction makes a copy
+        # memory-mapped datasets with many frames are drawn from every n'th frame, so only those are read and copied
+        frames = im[0].shape[0]
+        step = 1
+        if not self.store_directory is None:
+            step = max(1,-(-frames//us.out_of_core_surface_rows))
         # generate ticks for images
-        lambd = self.lambd[index]
+        lambd = self.data[index].lambd
         if self.actionToggle_Q.isChecked() and isinstance(lambd,float):
             x = tth2Q(tth,lambd)
             self.miw.setXLabel('Q (Å<sup>-1</sup>)')
@@ -765,16 +1062,11 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             self.actionToggle_Q.setChecked(False)
             self.miw.setXLabel('2θ (°)')
         ticks = generateTicks(x)
-        scale = self.scale_surf
-        bgr = self.bgr[index]
-        for i in range(2):
-            if self.subtract_bgr:
-                im[i] -= np.rot90(bgr,k=1)
-                #im[i] -= bgr
-            self.miw.setData(i,scaleArray(im[i],scale))
+        dataset = self.data[index]
+        subtract_bgr = self.subtract_bgr and not isAbsent(dataset.bgr)
+        for i in range(3):
+            self.miw.setData(i,*self.displayImage(dataset,i,step,subtract_bgr and i<2,self.scale_surf))
             self.miw.setTicks(i,ticks)
-        self.miw.setData(2,scaleArray(im[2],scale,retain_sign=True))
-        self.miw.setTicks(2,ticks)
         self.miw.autoRangeHistograms()
     
     def initScale(self):
@@ -794,8 +1086,8 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
                 scale.setChecked(False)
         self.scale_surf = current_scale
         index = self.dataset_index
-        im = self.im[index]
-        tth = self.tth[index]
+        im = self.data[index].im
+        tth = self.data[index].tth
         self.setMultiImages(tth,im)
         
     def setScalePattern(self):
@@ -829,8 +1121,8 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
         
     def setSubtractBgr(self):
         index = self.dataset_index
-        im = self.im[index]
-        tth = self.tth[index]
+        im = self.data[index].im
+        tth = self.data[index].tth
         self.subtract_bgr = self.actionSubtract_background.isChecked()
         self.setMultiImages(tth,im)
     
@@ -852,6 +1144,7 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
     def enableActions(self,enable):
         self.actionUpdate.setEnabled(enable)
         self.actionUpdate_2.setEnabled(enable)
+        self.actionWatch_folder.setEnabled(enable)
         self.actionAdd_files.setEnabled(enable)
         self.actionAdd_files_2.setEnabled(enable)
         self.actionRemove_dataset.setEnabled(enable)
@@ -865,7 +1158,8 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
 ##                                   Read data methods                                            ##
 ####################################################################################################
 
-    def openFiles(self,files=None,ext=None):
+    def openFiles(self,files=None,ext=None,add=False):
+        """Open files as the current dataset, or as a new dataset if add is True"""
         if not isinstance(files,list):
             path = self.path
             if not path:
@@ -877,82 +1171,133 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             files, ext =  QtWidgets.QFileDialog.getOpenFileNames(self, 'Select files', path , filters)
         if len(files)<1:
             return
-        index = self.dataset_index
+        self.path = os.path.dirname(files[0])
+        if ext=='*.raw':
+            # the logo is shown at once
+            self.setLoadedFiles({'target':self.datasets[self.dataset_index]},ext,self.path,([],self.openRAW(files[0])))
+            return
+        self.loadFiles(files,ext,None if add else self.datasets[self.dataset_index])
+    
+    def loadFiles(self,files,ext,target):
+        """Read files in the loader thread and store them in the dataset of the toolbar action target, see getLoadTarget"""
         path = os.path.dirname(files[0])
-        self.path = path
+        load = {'target':target, # updated to the new toolbar action when the dataset is first shown
+                'shown':False,   # the dataset has been shown while loading
+                'view':None}     # view of the surfaces after the previous update
+        partial = None
+        if ext!='*.par':
+            partial = lambda result: self.setLoadedFiles(load,ext,path,([],result),partial=True)
+        self.startLoading(self.readDataset,(files,ext,path),
+                          lambda result: self.setLoadedFiles(load,ext,path,result),
+                          'Reading {}'.format(os.path.basename(path)),
+                          partial)
+    
+    def readDataset(self,files,ext,path,progress):
+        """
+        Read files from the cache or with the open* method for ext - called in the loader thread.
+        Return the file stats and the output of the open* method
+        """
+        if ext=='*.par':
+            return [], self.openPAR(files[0],path,progress)
+        stats = fileStats(files)
+        key = self.getCacheKey(files,ext)
+        result = self.readCachedFiles(key)
+        if not result is None:
+            return stats, result
+        if ext=='*.xyy':
+            result = self.openXYY(files,progress=progress)
+        elif ext=='*.prf':
+            result = self.openPRF(files,progress=progress)
+        elif ext=='*.dat':
+            result = self.openDAT(files,progress=progress)
+        elif ext=='*.xye *.xy' or ext=='*.xye' or ext=='*.xy':
+            result = self.openXYE(files,progress=progress)
+        elif ext=='*.csv':
+            result = self.openCSV(files[0])
+        im, tth, files, lambd, param, sub_plots, bgr, statistics, par_file, was_canceled = result
+        if not was_canceled and not key is None:
+            writeCache(self.cache_directory, key, im, tth, files, lambd, param, sub_plots, bgr, statistics, us.cache_size_limit*1e6)
+        return stats, result
+    
+    def getLoadTarget(self,target):
+        """Return the index of the dataset of the toolbar action target - add a new dataset if target is None or has been removed"""
+        if target in self.datasets:
+            return self.datasets.index(target)
+        if not isinstance(self.datasets[0],QtWidgets.QAction):
+            return 0 # all datasets have been removed
+        self.addDataset(is_par=True)
+        return self.dataset_index
+    
+    def setLoadedFiles(self,load,ext,path,result,partial=False):
+        """
+        Store and show a dataset read by readDataset in the dataset of the toolbar action load['target'], see loadFiles.
+        Also called with the frames read so far while loading (partial) - the dataset is then only redrawn if it is still shown.
+        """
+        stats, result = result
+        if len(result[0])<1: # canceled before any frames were read
+            return
+        shown = load.get('shown',False) and load['target'] in self.datasets
+        index = self.getLoadTarget(load['target'])
         try:
-            if ext=='*.raw':
-                im, tth, files, lambd, param, sub_plots, bgr, par_file, was_canceled = self.openRAW(files[0])
-                label = 'Reel1.0'
-            else:
-                if ext=='*.xyy':
-                    im, tth, files, lambd, param, sub_plots, bgr, par_file, was_canceled = self.openXYY(files)
-                elif ext=='*.prf':
-                    im, tth, files, lambd, param, sub_plots, bgr, par_file, was_canceled = self.openPRF(files)
-                elif ext=='*.dat':
-                    im, tth, files, lambd, param, sub_plots, bgr, par_file, was_canceled = self.openDAT(files)
-                elif ext=='*.xye *.xy' or ext=='*.xye' or ext=='*.xy':
-                    im, tth, files, lambd, param, sub_plots, bgr, par_file, was_canceled = self.openXYE(files)
-                elif ext=='*.csv':
-                    im, tth, files, lambd, param, sub_plots, bgr, par_file, was_canceled = self.openCSV(files[0])
-                elif ext=='*.par':
-                    # im, tth, files, lambd, param, sub_plots, bgr, par_file, was_canceled = self.openPAR(files[0], path)
-                    datasets, par_file, was_canceled = self.openPAR(files[0], path)
-                    if was_canceled:
-                        return
-                    if par_file == self.par_file[index]:
-                        self.removeAllDatasets()
-                    for i, dataset in enumerate(datasets):
-                        im, tth, files, lambd, param, sub_plots, bgr = dataset
-                        if i>0:
-                            self.addDataset(is_par=True)
-                        self.im[i] = im
-                        self.tth[i] = tth
-                        self.files[i] = files
-                        self.lambd[i] = lambd
-                        param['Mean intensity'] = np.flip(np.nanmean(im[0,:,:],axis=0))
-                        self.param[i] = param
-                        self.sub_plots[i] = sub_plots
-                        self.bgr[i] = bgr
-                        self.par_file[i] = par_file
-                        
-                        label = '{}'.format(files[0].split(' η')[0])
-                        self.addToolbarAction(label,index+i)
-                        
-                    
-                    tth = self.tth[index]
-                    im = self.im[index]
-                
-                if was_canceled:
-                    return
-                label = '{}'.format(os.path.basename(path))
+            if ext=='*.par':
+                self.dataset_index = index
+                datasets, par_file, was_canceled = result
+                if par_file == self.data[index].par_file:
+                    self.removeAllDatasets()
+                    index = self.dataset_index
+                for i, (label, dataset, pending) in enumerate(datasets):
+                    if i>0:
+                        self.addDataset(is_par=True)
+                    self.data[index+i].par_file = par_file
+                    self.data[index+i].par_pending = pending
+                    if not dataset is None:
+                        self.setParDataset(index+i,dataset)
+                    self.addToolbarAction(label,index+i)
+                # show the first dataset
+                self.dataset_index = index
+                [ac.setChecked(i==index) for i, ac in enumerate(self.datasets) if isinstance(ac,QtWidgets.QAction)]
+                self.setSurfaceplotLabels(index)
+                tth = self.data[index].tth
+                im = self.data[index].im
                 self.setWindowTitle('{} - Reel'.format(path))
                 self.enableActions(True)
-            if not ext=='*.par':
-                
-                self.addToolbarAction(label,index)
-                param['Mean intensity'] = np.flip(np.nanmean(im[0,:,:],axis=0))
-                
+            else:
+                im, tth, files, lambd, param, sub_plots, bgr, statistics, par_file, was_canceled = result
+                if not shown:
+                    if ext=='*.raw':
+                        label = 'Reel1.0'
+                    else:
+                        label = '{}'.format(os.path.basename(path))
+                        self.setWindowTitle('{} - Reel'.format(path))
+                        self.enableActions(True)
+                    self.dataset_index = index
+                    self.addToolbarAction(label,index)
+                    load['target'] = self.datasets[index]
+                    load['shown'] = True
                 # deviation from mean
-                if np.all(im[1]==0):
-                    self.dev_from_mean[index] = True
-                    im[0][im[0]<=0.0]=np.nan
-                    mean = np.nanmean(im[0],axis=1)
-                    mean = np.full(im[0].T.shape,mean,dtype='float32').T
-                    im[1] = mean # mean
-                    im[2] = (im[0]-mean)/mean*100 # (obs-mean)/mean*100%
+                if isAbsent(im[1]) or not np.any(im[1]):
+                    self.data[index].dev_from_mean = True
+                    # the frames are still being written to by the loader thread and depend on all frames
+                    if not partial:
+                        self.setDeviationFromMean(im,statistics)
 
                 else:
-                    self.dev_from_mean[index] = False
+                    self.data[index].dev_from_mean = False
+                self.data[index].setData(im,tth,files,lambd,param,sub_plots,bgr,statistics)
+                self.data[index].file_stats = stats[:len(files)]
+                self.data[index].par_file = par_file
+                self.data[index].loading = partial
+                if shown:
+                    if index == self.dataset_index:
+                        # redraw and follow the new frames, until the view is moved
+                        load['follow'] = load.get('follow',True) and self.miw.getViewRect() == load['view']
+                        self.changeDataset(index)
+                        if load['follow']:
+                            self.miw.autoRange()
+                            self.parw.autoRange()
+                        load['view'] = self.miw.getViewRect()
+                    return
                 self.setSurfaceplotLabels(index)
-                self.im[index] = im.astype(dtype='float32')
-                self.tth[index] = tth
-                self.files[index] = files
-                self.lambd[index] = lambd
-                self.param[index] = param
-                self.sub_plots[index] = sub_plots
-                self.bgr[index] = bgr
-                self.par_file[index] = par_file
 
             self.setMultiImages(tth,im)
             self.setSubplotActions()
@@ -961,52 +1306,173 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
             self.initParameterPlot()
             self.autoRangeAll()
             self.showCurrentWavelength()
+            self.manageMemory()
+            load['view'] = self.miw.getViewRect()
             
         except:
             QtWidgets.QMessageBox.warning(self,'Warning','Unable to open selected files!')    
             self.setWindowTitle('Reel')
             self.toolBarLabel.setText('')
             raise
+    
+    def startLoading(self,function,args,finished,label,partial=None):
+        """
+        Run function(*args, progress) in the loader thread and pass the return value to finished in the main thread.
+        If partial is given, it is called with the frames read so far every us.progressive_interval while loading.
+        Loads are queued and run one at a time.
+        """
+        self.load_queue.append((function,args,finished,label,partial))
+        if self.loader is None:
+            self.loadNext()
+    
+    def loadNext(self):
+        """Start the next queued load"""
+        if len(self.load_queue)<1:
+            for widget in (self.loadLabel,self.loadBar,self.loadCancel):
+                widget.hide()
+            return
+        function, args, finished, label, partial = self.load_queue.pop(0)
+        self.loader = LoadThread(function,args,0 if partial is None else us.progressive_interval)
+        self.load_finished = finished
+        self.load_partial = partial
+        self.loader.sigValue.connect(self.loadBar.setValue)
+        self.loader.sigRange.connect(self.loadBar.setRange)
+        self.loader.sigLabel.connect(self.setLoadLabel)
+        self.loader.sigPartial.connect(self.loadingPartial)
+        self.loader.sigFinished.connect(self.loadingFinished)
+        self.loader.sigFailed.connect(self.loadingFailed)
+        self.setLoadLabel(label)
+        self.loadBar.setRange(0,0)
+        for widget in (self.loadLabel,self.loadBar,self.loadCancel):
+            widget.show()
+        self.loader.start()
+    
+    def setLoadLabel(self,text):
+        """Show the last line of a progress label next to the loading progress bar"""
+        self.loadLabel.setText(text.split('\n')[-1])
+        self.loadLabel.setToolTip(text)
+    
+    def cancelLoading(self):
+        if not self.loader is None:
+            self.loader.cancel()
+    
+    def loadingPartial(self,result):
+        try:
+            self.load_partial(result)
+        finally:
+            self.loader.partialShown()
+    
+    def loadingFinished(self,result):
+        finished = self.load_finished
+        self.loader.wait()
+        self.loader = None
+        try:
+            finished(result)
+        finally:
+            self.loadNext()
+    
+    def loadingFailed(self,error):
+        self.loader.wait()
+        self.loader = None
+        # the traceback of the error is shown on request
+        message = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Warning,'Warning','Unable to open selected files!',parent=self)
+        message.setDetailedText(error)
+        message.exec_()
+        self.loadNext()
             
-    def openXYY(self,files):
-        progress = self.progressWindow("Reading files", "Cancel", 0, len(files),'Refinement Evaluator',QtGui.QIcon(":icons/Main.png"))
-        im = [[],[],[]]
-        bgr, temp, lambd, filenames, comments = [], [], [], [], []
-        _, sub_plots, param = {}, {}, {'R_p':[]}
-            
-        for i, file in enumerate(files):
+    def getCacheKey(self,files,ext):
+        """Return disk cache key for the files, or None if the format is not cached or the cache is disabled"""
+        if not us.cache_size_limit or ext=='*.par':
+            return None
+        try:
+            return cacheKey(files)
+        except OSError:
+            return None
+    
+    def readCachedFiles(self,key):
+        """Return dataset from the disk cache in the same form as the open* methods, or None"""
+        if key is None:
+            return None
+        cached = readCache(self.cache_directory, key)
+        if cached is None:
+            return None
+        return (*cached, [''], False)
+    
+    def setDeviationFromMean(self,im,statistics,start=0):
+        """
+        Replace calculated and residual of im with the mean and deviation from mean of the observed patterns,
+        in a single pass in chunks of frames. The mean of the positive values is taken from statistics (PatternStatistics),
+        and is a placeholder repeating the mean pattern, see placeholder.
+        If start is given, only the frames from start were appended - they are compared to the mean of the previous frames
+        """
+        obs = im[0]
+        frames = obs.shape[0]
+        if start>0:
+            mean = im[1][0]
+            dev = appendFrames(im[2],np.empty((frames-start,obs.shape[1]),dtype='float32'),self.store_directory)
+        else:
+            mean = statistics.mean()
+            dev = im[2]
+            if isPlaceholder(dev) or dev.shape != obs.shape:
+                dev = allocate(obs.shape,'float32',self.store_directory)
+        im[1] = placeholder(mean,frames)
+        for s in chunkRows(obs[start:]):
+            s = slice(s.start+start,s.stop+start)
+            o = obs[s]
+            o[o<=0.0]=np.nan
+            # (obs-mean)/mean*100% computed in place
+            np.subtract(o,mean,out=dev[s])
+            dev[s] /= mean
+            dev[s] *= 100
+        im[2] = dev
+    
+    def openXYY(self,files,results=None,progress=None):
+        progress = self.initProgress(progress,len(files))
+        n = len(files)
+        temp, lambd, filenames, comments = [], [], [], []
+        sub_plots, param = {}, {'R_p':[]} # R_p is derived from the statistics, see partialResult
+        canceled = False
+        if results is None:
+            reading = readFiles(readXYY, files, us.loader_workers)
+        else:
+            reading = (result for result in results) # already read by pollWatchedFolder
+        for i, (header, data) in enumerate(reading):
             progress.setValue(i)
-            header, data = readXYY(file)
             # "tth" and "Y_obs" are the only mandatory columns
             tth = data.pop('tth')
             yobs = data.pop('Y_obs')
+            if i<1:
+                # preallocate (frames, points) channels - each pattern is a contiguous row
+                length = yobs.shape[0]
+                im = [allocate((n,length),'float32',self.store_directory) for _ in range(3)]
+                bgr = placeholder(np.zeros(length,dtype='float32'),n) # allocated if the files have a background
+                statistics = PatternStatistics(n,length)
             keys = list(data.keys())
             # get data with special meaning
+            im[0][i] = yobs
             if 'Y_calc' in keys:
                 ycal = data.pop('Y_calc')
+                im[1][i] = ycal
             else:
-                ycal = np.full(yobs.shape,0,dtype='float16')
+                ycal = im[1][i]
             if 'Y_res' in keys:
                 res = data.pop('Y_res')
+                im[2][i] = res
             elif np.any(ycal>0):
                 res = yobs-ycal
+                im[2][i] = res
             else:
-                res = np.full(yobs.shape,0,dtype='float16')
+                res = im[2][i]
             if 'Background' in keys:
-                bgr.append(data['Background'])
-            else:
-                bgr.append(np.full(yobs.shape,0,dtype='float16'))
-                
-            im[0].append(yobs)
-            im[1].append(ycal)
-            im[2].append(res)
+                if isPlaceholder(bgr):
+                    bgr = allocate((n,length),'float32',self.store_directory)
+                bgr[i] = data['Background']
                 
             for key in data:
-                try:
-                    sub_plots[key].append(data[key])
-                except KeyError:
-                    sub_plots[key]=[data[key]]
-            param['R_p'].append(np.sum(abs(res))/np.sum(yobs)*100)
+                if not key in sub_plots:
+                    sub_plots[key] = allocate((n,length),'float32',self.store_directory,np.nan)
+                sub_plots[key][i] = data[key]
+            statistics.add(i,im[0][i],im[2][i])
             temp.append(header['Temperature (K)'])
             lambd.append(header.pop('Wavelength (Å)'))
             filenames.append(header.pop('Filename'))
@@ -1017,242 +1483,279 @@ class mainWindow(QtWidgets.QMainWindow, uic.loadUiType(os.path.join(os.path.dirn
                 except KeyError:
                     param[key]=[header[key]]
             if progress.wasCanceled():
-                return [], [], [], [], {}, {}, [''], True
+                # keep the frames read so far
+                reading.close()
+                canceled = True
+                break
+            if self.isPartialDue(progress):
+                progress.setPartial(self.partialResult((im, tth, files, np.mean([float(l) for l in lambd]), param, sub_plots, bgr, statistics, [''], False),i+1))
         
-        im = np.array(im, dtype='float32')
-        im = np.rot90(im,k=-1,axes=(1,2))
-        bgr = np.array(bgr)
-        bgr = np.rot90(bgr,k=-1)
         lambd = np.mean([float(l) for l in lambd])
-        param = {key:np.array(param[key],dtype='float32') for key in param}
-        sub_plots = {key:np.array(sub_plots[key]) for key in sub_plots}
         progress.setValue(len(files))
-        return im, tth, files, lambd, param, sub_plots, bgr, [''], False
+        return self.partialResult((im, tth, files, lambd, param, sub_plots, bgr, statistics, [''], canceled),i+1)
 
-    def openPRF(self,files):
-        progress = self.progressWindow("Reading files", "Cancel", 0, len(files),'Refinement Evaluator',QtGui.QIcon(":icons/Main.png"))
-        im =[[],[],[]]
-        bgr = []
+    def openPRF(self,files,results=None,progress=None):
+        progress = self.initProgress(progress,len(files))
+        n = len(files)
         temp=[]
-        param = {'R_p':[]}
+        param = {'R_p':[]} # R_p is derived from the statistics, see partialResult
         sub_plots = {}
-        for i, file in enumerate(files):
+        canceled = False
+        if results is None:
+            reading = readFiles(readPrfAny, files, us.loader_workers)
+        else:
+            reading = (result for result in results) # already read by pollWatchedFolder
+        for i, (tth, yobs, ycal, res, bckg, T, excl_reg, lambd, sub_plot) in enumerate(reading):
             progress.setValue(i)
-            try:
-                tth, yobs, ycal, res, bckg, T, excl_reg, lambd = readPRF(file)
-                res = np.array([float(yobs[i])-float(ycal[i]) for i in range(len(yobs))])
-                sub_plot = {}
-            except ValueError:
-                tth, yobs, ycal, res, bckg, excl_reg, sub_plot = readPrfAlt(file)
-                T, lambd = None, [None]
+            if not lambd[0] is None:
+                # FullProf format
+                res = yobs.astype('float64')-ycal
             res[excl_reg]=0
             ycal[excl_reg]=np.nan
-            im[0].append(yobs)
-            im[1].append(ycal)
-            im[2].append(res)
-            bgr.append(bckg)
+            if i<1:
+                # preallocate (frames, points) channels - each pattern is a contiguous row
+                length = yobs.shape[0]
+                im = [allocate((n,length),'float32',self.store_directory) for _ in range(3)]
+                bgr = allocate((n,length),'float32',self.store_directory)
+                statistics = PatternStatistics(n,length)
+            im[0][i] = yobs
+            im[1][i] = ycal
+            im[2][i] = res
+            bgr[i] = bckg
             temp.append(T)
             for key in sub_plot:
-                try:
-                    sub_plots[key].append(sub_plot[key])
-                except KeyError:
-                    sub_plots[key]=[sub_plot[key]]
-            param['R_p'].append(np.sum(abs(res[excl_reg==False]))/np.sum(yobs[excl_reg==False])*100)
+                if not key in sub_plots:
+                    sub_plots[key] = allocate((n,length),'float32',self.store_directory,np.nan)
+                sub_plots[key][i] = sub_plot[key]
+            statistics.add(i,im[0][i],im[2][i],excl_reg==False)
             if progress.wasCanceled():
-                return [], [], [], [], {}, {}, [''], True
-        im = np.array(im, dtype='float32')
-        im = np.rot90(im,k=-1,axes=(1,2))
-        bgr = np.array(bgr)
-        bgr = np.rot90(bgr,k=-1)
-        sub_plots = {key:np.array(sub_plots[key]) for key in sub_plots}
+                # keep the frames read so far
+                reading.close()
+                canceled = True
+                break
+            if self.isPartialDue(progress):
+                progress.setPartial(self.partialResult((im, tth, files, lambd[0], param, sub_plots, bgr, statistics, [''], False),i+1))
         if not None in temp:
             if min(temp)<273.15: # Guess the unit based on minimum value
                 key = 'Temperature (°C)'
             else:
                 key = 'Temperature (K)'
             param[key] = temp    
-        param = {key:np.array(param[key],dtype='float32') for key in param}
         progress.setValue(len(files))
-        return im, tth, files, lambd[0], param, sub_plots, bgr, [''], False
+        return self.partialResult((im, tth, files, lambd[0], param, sub_plots, bgr, statistics, [''], canceled),i+1)
             
-    def openPAR(self, file, path):
-        """Open MAUD .par file"""
-        #try:
-        datasets=[]
-        # im = [[],[],[]]
-        # sub_plots={}
-        #####  Open the primary .par file  #####
-        progress = self.progressWindow("Reading files", "Cancel", 0, 1,'Refinement Evaluator',QtGui.QIcon(":icons/Main.png"))
+    def openPAR(self, file, path, progress=None):
+        """
+        Open MAUD .par file. All datasets are read and mapped to grid coordinates in the pool of worker processes,
+        but only the first dataset is waited for - the rest are collected by loadParDataset when first displayed.
+        Return list of (label, dataset, pending) - dataset is None if not collected yet
+        """
+        progress = self.initProgress(progress,2)
         progress.setLabelText('{}\nReading'.format(file))
-        
-        r, obs, dist, lambd, x_corr , y_corr, dataset_id, datafile_id, eta = readPAR(file)
-        num = len(dataset_id)*2
-        progress.setMaximum(num)
-        
-        # Determine number of bins for each datasets
-        bins = [len(x) for x in obs]
+        header = indexPAR(file)
+        dataset_id, blocks = header[4], header[7]
         # Determine length of longest datafile across all n datasets
-        length = max([max(map(len,n)) for n in r])
-        empty = np.full((2,length),np.nan,dtype='float16') # empty row(s) to separate each dataset
-        empty[:,0] = 0.0 # Add a single non-nan value to suppress All-NaN slice RuntimeWarning
-
-        for n, name in enumerate(dataset_id):
-            im = [[],[],[]]
-            sub_plots={}
-            progress.setValue(n*2)
-            #progress.setLabelText('Reading dataset {}:{}'.format(n+1,len(dataset_id)))
-            progress.setLabelText('{} {}:{}\nReading .fit files'.format(name,n+1,len(dataset_id)))
-            # Open subsequent .fit files for each dataset
-            files = datafile_id[n*bins[n]:(n+1)*bins[n]]
-
-            r_cal, cal, bckg, data = self.openFITs(path, files)  #, dist[n], x_corr[n], y_corr[n])
-
-            progress.setValue(n*2+1)
-            progress.setLabelText('{} {}:{}\nMapping to grid coordinates'.format(name,n+1,len(dataset_id)))
-            xi, yi, zi_obs, mask = gridInterpolation(r[n],obs[n],eta[n],x_corr[n],y_corr[n],dist[n],length,xi=None,yi=None,mask=None)
-            xi_calc, yi_calc, zi_calc, mask_calc = gridInterpolation(r_cal,cal,eta[n],x_corr[n],y_corr[n],dist[n],length,xi=xi,yi=yi,mask=None)
-            _, _, zi_bgr, _ = gridInterpolation(r_cal,bckg,eta[n],x_corr[n],y_corr[n],dist[n],length,xi=xi,yi=yi,mask=mask_calc)
-            zi_res = zi_obs-zi_calc 
-            for key in data:
-                I = data[key]
-                xi_sub, yi_sub, zi_sub, mask_sub = gridInterpolation(r_cal,I,eta[n],x_corr[n],y_corr[n],dist[n],length,xi=xi,yi=yi,mask=mask_calc)
-                sub_plots[key] = zi_sub
+        length = max([max([b[3] for b in n]) for n in blocks])
+        args = [(file, path, n, header, length, us.par_interpolation, us.fit_threads) for n in range(len(dataset_id))]
+        if getWorkers(us.loader_workers) > 1:
+            futures = [submitParDataset(*a,workers=us.loader_workers) for a in args]
+        else:
+            futures = [None]*len(args) # read in this process when displayed
+        progress.setValue(1)
+        progress.setLabelText('{} 1:{}\nReading .fit files and mapping to grid coordinates'.format(dataset_id[0],len(dataset_id)))
+        dataset = self.collectParDataset((futures[0],args[0]),progress)
+        if dataset is None or progress.wasCanceled():
+            [future.cancel() for future in futures if not future is None]
+            return [], [''], True
+        progress.setValue(2)
+        datasets = [(dataset_id[0], dataset, None)]+[(dataset_id[n], None, (futures[n],args[n])) for n in range(1,len(args))]
+        return datasets, [file], False
+    
+    def collectParDataset(self, pending, progress):
+        """
+        Return the dataset of pending (Future or None, arguments for readParDataset) - read in this process if there is no Future.
+        Return None if canceled from progress - a progress dialog, or the loader thread.
+        """
+        future, args = pending
+        if future is None:
+            return readParDataset(*args)
+        while not future.done():
             if progress.wasCanceled():
-                return [], [], [], [], {}, {}, [''], True
-            yobs, ycal, res, bgr = zi_obs, zi_calc, zi_res, zi_bgr
-            rp = np.divide(np.nansum(np.abs(res),axis=1),np.nansum(yobs,axis=1))*100
-            files = ['{} η: {:5.1f} °.par'.format(name, e) for e in eta[n]]
-  
-            im[0] = yobs
-            im[1] = ycal
-            im[2] = res  
-    
-            im = np.array(im, dtype='float32')
-            im = np.rot90(im,k=-1,axes=(1,2))
-            bgr = np.array(bgr)
-            bgr = np.rot90(bgr,k=-1)
-            param = {'R_p':np.array(rp,dtype='float32')}
-            datasets.append((im, xi, files, np.mean(lambd), param, sub_plots, bgr))
-        progress.setValue(num)
-        return datasets, [file], False   
-        
-    def openFITs(self,path, datafile_id):  #, dist, x_corr, y_corr):
-        """Open multiple .fit files from a list of filenames - called by openPAR"""
-        sub_plots = {}
-        r = []
-        I   = []
-        bgr = []
-        for f, enabled in datafile_id:
-            try:
-                if enabled:
-                    fname = '{}/{}{}.fit'.format(path,*f.split('.esg'))
-                    data = readFIT(fname)  #, dist, x_corr, y_corr)
-                    r.append(data.pop('r'))
-                    I.append(data.pop('I'))
-                    bgr.append(data.pop('background'))
-                    for key in data:
-                        y = data[key]
-                        try:
-                            sub_plots[key].append(y)
-                        except KeyError:
-                            sub_plots[key]=[y]
-                else:
-                    raise FileNotFoundError
-            except FileNotFoundError:
-                r.append(np.array([0.0]))
-                I.append(np.array([np.nan]))
-                bgr.append(np.array([np.nan]))
-                for key in sub_plots.keys():
-                    try:
-                        sub_plots[key].append(np.array([np.nan]))
-                    except KeyError:
-                        sub_plots[key] = [np.array(np.nan)]
-
-        for key in sub_plots.keys():
-            sub_plots[key] = np.array(sub_plots[key],dtype=object)
-        return r, I, bgr, sub_plots
+                return None
+            wait([future],timeout=0.05)
+            if isinstance(progress,QtWidgets.QProgressDialog):
+                # user input only reaches the modal progress dialog once it is shown
+                flags = QtCore.QEventLoop.AllEvents if progress.isVisible() else QtCore.QEventLoop.ExcludeUserInputEvents
+                QtWidgets.QApplication.processEvents(flags)
+        try:
+            return future.result()
+        except (BrokenProcessPool, CancelledError):
+            return readParDataset(*args)
+    
+    def loadParDataset(self, index):
+        """Collect a dataset of a .par file the first time it is displayed - return False if canceled"""
+        future, args = self.data[index].par_pending
+        progress = self.progressWindow("Reading files", None, 0, 0,'Refinement Evaluator',QtGui.QIcon(":icons/Main.png"))
+        progress.setLabelText('{} {}:{}\nReading .fit files and mapping to grid coordinates'.format(args[3][4][args[2]],args[2]+1,len(args[3][4])))
+        if future is None:
+            # read in a separate thread to keep the window painted - left to finish on its own if canceled
+            executor = ThreadPoolExecutor(max_workers=1)
+            dataset = self.collectParDataset((executor.submit(readParDataset,*args),args),progress)
+            executor.shutdown(wait=False)
+        else:
+            dataset = self.collectParDataset(self.data[index].par_pending,progress)
+        progress.close()
+        if dataset is None:
+            # still pending - read again the next time the dataset is selected
+            return False
+        self.setParDataset(index,dataset)
+        self.data[index].par_pending = None
+        return True
     
-    def openDAT(self,files):
-        progress = self.progressWindow("Reading files", "Cancel", 0, len(files),'Refinement Evaluator',QtGui.QIcon(":icons/Main.png"))
-        im =[[],[],[]]
+    def cancelParPending(self, pending):
+        """Cancel reading .par datasets that have not been displayed"""
+        for p in pending:
+            if not p is None and not p[0] is None:
+                p[0].cancel()
+    
+    def setParDataset(self, index, dataset):
+        """Store a dataset returned by readParDataset at index"""
+        im, tth, files, lambd, param, sub_plots, bgr = dataset
+        statistics = PatternStatistics.fromFrames(im[0],im[2])
+        param.update(statistics.parameters())
+        self.data[index].setData(list(im),tth,files,lambd,param,sub_plots,bgr,statistics)
+        self.data[index].dev_from_mean = False
+    
+    def openDAT(self,files,results=None,progress=None):
+        progress = self.initProgress(progress,len(files))
+        n = len(files)
         temp=[]
-        for i, file in enumerate(files):
+        canceled = False
+        if results is None:
+            reading = readFiles(readDAT, files, us.loader_workers)
+        else:
+            reading = (result for result in results) # already read by pollWatchedFolder
+        for i, (x,yobs,T,lambd, _, _) in enumerate(reading):
             progress.setValue(i)
-            x,yobs,T,lambd, _, _ = readDAT(file)
             if i<1:
                 tth = x
                 length = yobs.shape[0]
-            if yobs.shape[0]>length:
-                rest = length-yobs.shape[0]
-                yobs = np.append(yobs,[np.nan]*rest)
-            im[0].append(yobs[:length])
-            im[1].append(np.full(length,0,dtype='float16'))
-            im[2].append(np.full(length,0,dtype='float16'))
+                # preallocate the observed (frames, points) - each pattern is a contiguous row
+                im = self.observedChannels(n,length)
+                bgr = placeholder(np.zeros(length,dtype='float32'),n)
+                statistics = PatternStatistics(n,length)
+            self.setFrame(im[0],i,yobs)
+            statistics.add(i,im[0][i])
             temp.append(T)
             if progress.wasCanceled():
-                return [], [], [], [], {}, {}, [''], True
-        im = np.array(im, dtype='float32')
-        im = np.rot90(im,k=-1,axes=(1,2))
-        bgr = np.full(im[0].shape,0,dtype='float32')
+                # keep the frames read so far
+                reading.close()
+                canceled = True
+                break
+            if self.isPartialDue(progress):
+                progress.setPartial(self.partialResult((im, tth, files, lambd, {}, {}, bgr, statistics, [''], False),i+1))
         if not None in temp:
             if min(temp)<273.15: # Guess the unit based on minimum value
                 key = 'Temperature (°C)'
             else:
                 key = 'Temperature (K)'
-            param = {key:np.array(temp,dtype='float32')}
+            param = {key:temp}
         else:
             param = {}
         progress.setValue(len(files))
-        return im, tth, files, lambd, param, {}, bgr, [''], False
+        return self.partialResult((im, tth, files, lambd, param, {}, bgr, statistics, [''], canceled),i+1)
  
-    def openXYE(self,files):
-        progress = self.progressWindow("Reading files", "Cancel", 0, len(files),'Refinement Evaluator',QtGui.QIcon(":icons/Main.png"))
-        im =[[],[],[]]
-        for i, file in enumerate(files):
+    def openXYE(self,files,results=None,progress=None):
+        progress = self.initProgress(progress,len(files))
+        n = len(files)
+        canceled = False
+        if results is None:
+            reading = readFiles(readXYE, files, us.loader_workers)
+        else:
+            reading = (result for result in results) # already read by pollWatchedFolder
+        for i, (x,yobs,_) in enumerate(reading):
             progress.setValue(i)
-            x,yobs,_ = readXYE(file)
             if i<1:
                 tth = x
                 length = yobs.shape[0]
-            if yobs.shape[0]<length:
-                rest = length-yobs.shape[0]
-                yobs = np.append(yobs,[np.nan]*rest)
-            im[0].append(yobs[:length])
-            im[1].append(np.full(length,0,dtype='float16'))
-            im[2].append(np.full(length,0,dtype='float16'))
+                # preallocate the observed (frames, points) - each pattern is a contiguous row
+                im = self.observedChannels(n,length)
+                bgr = placeholder(np.zeros(length,dtype='float32'),n)
+                statistics = PatternStatistics(n,length)
+            self.setFrame(im[0],i,yobs)
+            statistics.add(i,im[0][i])
             if progress.wasCanceled():
-                return [], [], [], [], {}, {}, [''], True
-        im = np.array(im, dtype='float32')
-        im = np.rot90(im,k=-1,axes=(1,2))
-        bgr = np.full(im[0].shape,0,dtype='float16')
+                # keep the frames read so far
+                reading.close()
+                canceled = True
+                break
+            if self.isPartialDue(progress):
+                progress.setPartial(self.partialResult((im, tth, files, None, {}, {}, bgr, statistics, [''], False),i+1))
         progress.setValue(len(files))
-        return im, tth, files, None, {}, {}, bgr, [''], False
+        return self.partialResult((im, tth, files, None, {}, {}, bgr, statistics, [''], canceled),i+1)
 
     def openCSV(self,file):
         file = file.replace('_meta.csv','.csv')
         tth, im_obs = readCSV(file)
-        im = np.full((3,im_obs.shape[0],im_obs.shape[1]),0, dtype='float32')
-        im[0,:,:] = im_obs.astype('float32')
-        #im = np.fliplr(im)
-        bgr = np.full(im[0].shape,0,dtype='float16')
+        n, length = im_obs.shape
+        absent = placeholder(np.zeros(length,dtype='float32'),n)
+        im = [im_obs.astype('float32',copy=False), absent, absent]
+        bgr = absent
         fname = os.path.split(file)[-1][:-4]
-        files = ['{}: {}.csv'.format(fname,i+1) for i in range(im.shape[2])]
-        return im, tth, files, None, {}, {}, bgr, [''], False
+        files = ['{}: {}.csv'.format(fname,i+1) for i in range(n)]
+        statistics = PatternStatistics.fromFrames(im[0])
+        return im, tth, files, None, statistics.parameters(), {}, bgr, statistics, [''], False
     
     def openRAW(self,file):
         img = np.fromfile(file, dtype='ubyte').reshape(230,230).astype(float)
         img = img/img.max()
         img = np.abs(img-img.max()) #Invert
-        img = np.flipud(np.rot90(img))
-        im = np.full((3,img.shape[0],img.shape[1]),0, dtype='float32')
-        im[0:2,:,:] = img
-        im[2,:,:] = (img-0.5)/5
-        bgr = np.full(im[0].shape,0,dtype='float16')
-        tth = np.linspace(0,180,im.shape[1])
-        files = ['Reel1.0.' for i in range(im.shape[2])]
-        return im, tth, files, None, {}, {}, bgr, [''], False
+        img = np.flipud(img)
+        im = [img.astype('float32'), img.astype('float32'), ((img-0.5)/5).astype('float32')]
+        bgr = placeholder(np.zeros(img.shape[1],dtype='float32'),img.shape[0])
+        tth = np.linspace(0,180,img.shape[1])
+        files = ['Reel1.0.' for i in range(img.shape[0])]
+        statistics = PatternStatistics.fromFrames(im[0])
+        return im, tth, files, None, statistics.parameters(), {}, bgr, statistics, [''], False
         
         
+    def observedChannels(self,frames,points):
+        """Return (frames, points) channels with the observed preallocated, and placeholders for the absent calculated and residual"""
+        absent = placeholder(np.zeros(points,dtype='float32'),frames)
+        return [allocate((frames,points),'float32',self.store_directory), absent, absent]
+    
+    def setFrame(self,im,j,y):
+        """Write pattern y to row j of the preallocated (frames, points) array im - pad with NaN or truncate to fit"""
+        length = min(y.shape[0],im.shape[1])
+        im[j,:length] = y[:length]
+        im[j,length:] = np.nan
+
+    def isPartialDue(self,progress):
+        """Return True if progress is the loader thread and the frames read so far should be passed on with setPartial"""
+        return isinstance(progress,LoadThread) and progress.partialDue()
+    
+    def partialResult(self,result,k):
+        """
+        Return the first k frames of the output of an open* method, with im and bgr preallocated for all frames.
+        im and bgr are returned as views, the parameters derived from the statistics are added and param lists are converted to arrays
+        """
+        im, tth, files, lambd, param, sub_plots, bgr, statistics, par_file, was_canceled = result
+        im = [a[:k] for a in im]
+        bgr = bgr[:k]
+        statistics = statistics.head(k)
+        param = dict(param)
+        param.update(statistics.parameters())
+        param = {key:np.array(param[key][:k],dtype='float32') for key in param}
+        sub_plots = {key:sub_plots[key][:k] for key in sub_plots}
+        return im, tth, files[:k], lambd, param, sub_plots, bgr, statistics, par_file, was_canceled
+    
+    def initProgress(self,progress,maximum):
+        """Return progress (e.g. the loader thread) reset to the range 0 to maximum, or a new progress dialog if it is None"""
+        if progress is None:
+            return self.progressWindow("Reading files", "Cancel", 0, maximum,'Refinement Evaluator',QtGui.QIcon(":icons/Main.png"))
+        progress.setRange(0,maximum)
+        return progress
+    
     def progressWindow(self,label,cancel_label,min_val,max_val,window_title,icon=None):
         progress = QtWidgets.QProgressDialog(label, cancel_label, min_val, max_val)
         progress.setWindowModality(QtCore.Qt.WindowModal)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Disk cache of parsed datasets for Reel
+Each entry is a folder of .npy files and a meta.json file, named by a key
+generated from the path, size and modification time of the source files.
+"""
+import os
+import json
+import shutil
+import hashlib
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    if error.name in ('numpy'):
+        print('\n'+error.msg+'\nPlease use PIP to install: "pip install '+error.name+'"\n')
+from _lib.ReelDataset import PatternStatistics, placeholder, isPlaceholder
+
+_VERSION = 5 # Increment to invalidate old cache entries
+
+def cacheKey(files):
+    """Return cache key for a list of files from their path, size and modification time"""
+    h = hashlib.sha1('Reel cache {}\n'.format(_VERSION).encode())
+    for f in files:
+        st = os.stat(f)
+        h.update('{}|{}|{}\n'.format(os.path.abspath(f),st.st_size,st.st_mtime_ns).encode())
+    return h.hexdigest()
+
+def readCache(directory, key):
+    """
+    Return cached (im, tth, files, lambd, param, sub_plots, bgr, statistics) or None if not cached.
+    Arrays are memory-mapped copy-on-write, so they can be modified without changing the cache.
+    Placeholders are stored as their row and returned as placeholders again.
+    """
+    path = os.path.join(directory,key)
+    try:
+        with open(os.path.join(path,'meta.json'),'r',encoding='utf-8') as f:
+            meta = json.load(f)
+        placeholders = meta.get('placeholders',{})
+        def load(name):
+            a = np.load(os.path.join(path,name+'.npy'),mmap_mode='c')
+            return placeholder(a,placeholders[name]) if name in placeholders else a
+        im, tth, bgr = [load('im_{}'.format(i)) for i in range(3)], load('tth'), load('bgr')
+        param = {k:load('param_{}'.format(i)) for i, k in enumerate(meta['param'])}
+        sub_plots = {k:load('sub_plots_{}'.format(i)) for i, k in enumerate(meta['sub_plots'])}
+        statistics = PatternStatistics.fromArrays({k:load('statistics_'+k) for k in PatternStatistics.__slots__})
+    except (OSError, ValueError, KeyError):
+        return None
+    # Register the entry as recently used
+    os.utime(os.path.join(path,'meta.json'))
+    return im, tth, meta['files'], meta['lambd'], param, sub_plots, bgr, statistics
+
+def writeCache(directory, key, im, tth, files, lambd, param, sub_plots, bgr, statistics, limit=0):
+    """Write a dataset to the cache and evict the least recently used entries to stay below limit (bytes)"""
+    arrays = {'im_{}'.format(i):a for i, a in enumerate(im)}
+    arrays.update({'tth':tth, 'bgr':bgr})
+    arrays.update({'param_{}'.format(i):v for i, v in enumerate(param.values())})
+    arrays.update({'sub_plots_{}'.format(i):v for i, v in enumerate(sub_plots.values())})
+    arrays.update({'statistics_'+k:v for k, v in statistics.arrays().items()})
+    # placeholders are stored as their row
+    placeholders = {name:a.shape[0] for name, a in arrays.items() if isPlaceholder(a)}
+    for name in placeholders:
+        arrays[name] = arrays[name][0]
+    size = sum(np.asarray(a).nbytes for a in arrays.values())
+    if limit and size > limit:
+        return
+    meta = {'files':list(files),
+            'lambd':None if lambd is None else float(lambd),
+            'param':list(param.keys()),
+            'sub_plots':list(sub_plots.keys()),
+            'placeholders':placeholders}
+    path = os.path.join(directory,key)
+    tmp = path+'.tmp'
+    try:
+        shutil.rmtree(tmp,ignore_errors=True)
+        os.makedirs(tmp)
+        for name, a in arrays.items():
+            np.save(os.path.join(tmp,name+'.npy'),np.asarray(a))
+        with open(os.path.join(tmp,'meta.json'),'w',encoding='utf-8') as f:
+            json.dump(meta,f)
+        shutil.rmtree(path,ignore_errors=True)
+        os.replace(tmp,path)
+    except OSError:
+        # the cache is optional - e.g. the cache folder may be read-only
+        shutil.rmtree(tmp,ignore_errors=True)
+        return
+    pruneCache(directory,limit)
+
+def pruneCache(directory, limit):
+    """Remove the least recently used cache entries until the total size is below limit (bytes)"""
+    if not limit:
+        return
+    entries = []
+    for key in os.listdir(directory):
+        path = os.path.join(directory,key)
+        try:
+            used = os.stat(os.path.join(path,'meta.json')).st_mtime
+            size = sum(e.stat().st_size for e in os.scandir(path))
+        except OSError:
+            continue
+        entries.append((used,size,path))
+    entries.sort()
+    total = sum(e[1] for e in entries)
+    for used, size, path in entries:
+        if total <= limit:
+            break
+        # Entries still memory-mapped on Windows cannot be removed - try again next time
+        shutil.rmtree(path,ignore_errors=True)
+        total -= size
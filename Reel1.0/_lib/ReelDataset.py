@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Datasets shown in Reel
+"""
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    if error.name in ('numpy'):
+        print('\n'+error.msg+'\nPlease use PIP to install: "pip install '+error.name+'"\n')
+    raise
+from _lib.ReelMisc import chunkRows, allocate, frameBuffer, appendFrames
+
+class Dataset:
+    """
+    The patterns of one dataset and everything read with them.
+    im is a list of three (frames, points) channels - observed, calculated and residual, and bgr is (frames, points).
+    Channels that are constant over the frames, e.g. absent ones, are placeholders (see placeholder).
+    param and sub_plots map names to arrays with one value per frame and one pattern per frame.
+    """
+
+    __slots__ = ('im', 'tth', 'files', 'file_stats', 'par_file', 'par_pending', 'lambd',
+                 'sub_plots', 'bgr', 'param', 'statistics', 'dev_from_mean', 'revision', 'appended', 'loading', 'spilled')
+
+    def __init__(self):
+        self.im = np.zeros((3,100,100))
+        self.tth = np.arange(0,100,1)
+        self.files = ['']
+        self.file_stats = [] # (size, modification time) of each file when it was read
+        self.par_file = ['']
+        self.par_pending = None # (Future or None, arguments for ReelRead.readParDataset) until a .par dataset is first displayed
+        self.lambd = None
+        self.sub_plots = {}
+        self.bgr = []
+        self.param = {}
+        self.statistics = None # PatternStatistics of the observed patterns
+        self.dev_from_mean = False # use deviation from mean instead of calculated and residual
+        self.revision = 0 # incremented when the data changes, see modified
+        self.appended = None # (previous revision, frames) if the latest change only appended frames
+        self.loading = False # the frames are still being read in the loader thread
+        self.spilled = set() # ids of the arrays moved to files by spill
+
+    def setData(self, im, tth, files, lambd, param, sub_plots, bgr, statistics):
+        """Replace the data of the dataset with the output of an open* method"""
+        self.im = im
+        self.tth = tth
+        self.files = files
+        self.lambd = lambd
+        self.param = param
+        self.sub_plots = sub_plots
+        self.bgr = bgr
+        self.statistics = statistics
+        self.modified()
+
+    def modified(self, frames=None):
+        """
+        Register that the data of the dataset has changed, so images computed from it are computed again.
+        frames is the number of frames before the change if it only appended frames - images are then only extended
+        """
+        self.appended = None if frames is None else (self.revision, frames)
+        self.revision += 1
+
+    def arrays(self):
+        """Return a list of the arrays of the dataset"""
+        arrays = list(self.im)+[self.tth, self.bgr]
+        arrays += list(self.param.values())+list(self.sub_plots.values())
+        if not self.statistics is None:
+            arrays += list(self.statistics.arrays().values())
+        return [a for a in arrays if isinstance(a,np.ndarray)]
+
+    def nbytes(self):
+        """Return the number of bytes of memory held by the arrays of the dataset - memory-mapped arrays are not counted"""
+        return sum(heldBytes(frameBuffer(a)) for a in self.arrays() if not isMemoryMapped(a))
+
+    def spill(self, directory):
+        """
+        Move the patterns (im, bgr and sub_plots) held in memory to memory-mapped temporary files in directory,
+        to free the memory while the dataset is not shown. See restore
+        """
+        def move(a):
+            if not isinstance(a,np.ndarray) or isPlaceholder(a) or isMemoryMapped(a):
+                return a
+            b = allocate(a.shape,a.dtype,directory)
+            b[:] = a
+            self.spilled.add(id(b))
+            return b
+        self.im = [move(a) for a in self.im]
+        self.bgr = move(self.bgr)
+        self.sub_plots = {key:move(a) for key, a in self.sub_plots.items()}
+
+    def restore(self):
+        """Read the patterns moved to files by spill back into memory"""
+        if len(self.spilled)<1:
+            return
+        back = lambda a: np.array(a) if id(a) in self.spilled else a
+        self.im = [back(a) for a in self.im]
+        self.bgr = back(self.bgr)
+        self.sub_plots = {key:back(a) for key, a in self.sub_plots.items()}
+        self.spilled = set()
+
+    def release(self):
+        """Drop the arrays of the dataset, so their memory is freed even if the dataset itself is still referenced"""
+        self.im = np.zeros((3,100,100))
+        self.tth = np.arange(0,100,1)
+        self.bgr = []
+        self.param = {}
+        self.sub_plots = {}
+        self.statistics = None
+
+class PatternStatistics:
+    """
+    Statistics of the observed patterns of a dataset, accumulated frame by frame while the frames are read,
+    so parameters and the deviation from mean do not need extra passes over the patterns.
+    Per frame: sum, count, minimum and maximum of the non-NaN points, and the sums of the R-factor.
+    Per point: sum and count of the positive values over the frames.
+    """
+
+    FRAME_FIELDS = ('total', 'count', 'minimum', 'maximum', 'r_obs', 'r_res')
+    POINT_FIELDS = ('point_total', 'point_count')
+    __slots__ = FRAME_FIELDS+POINT_FIELDS
+
+    def __init__(self, frames, points):
+        for name in ('total', 'minimum', 'maximum', 'r_obs'):
+            setattr(self,name,np.full(frames,np.nan))
+        self.count = np.zeros(frames,dtype='int64')
+        self.r_res = np.full(frames,np.nan) # NaN if the frame has no residual
+        self.point_total = np.zeros(points)
+        self.point_count = np.zeros(points,dtype='int64')
+
+    @classmethod
+    def fromFrames(cls, obs, res=None):
+        """Return the statistics of all frames of the (frames, points) observed obs and residual res, accumulated in chunks of frames"""
+        statistics = cls(*obs.shape)
+        for s in chunkRows(obs):
+            statistics.add(s.start,obs[s],None if res is None else res[s])
+        return statistics
+
+    @classmethod
+    def fromArrays(cls, arrays):
+        """Return statistics from the arrays of PatternStatistics.arrays"""
+        statistics = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(statistics,name,arrays[name])
+        return statistics
+
+    def add(self, j, obs, res=None, include=None):
+        """
+        Accumulate the observed pattern obs, or the (frames, points) patterns starting, at frame j.
+        The R-factor is accumulated from the residual res over the points in include (default all).
+        """
+        obs = np.atleast_2d(obs)
+        rows = slice(j,j+obs.shape[0])
+        self.total[rows] = np.nansum(obs,axis=1,dtype='float64')
+        self.count[rows] = np.count_nonzero(~np.isnan(obs),axis=1)
+        self.minimum[rows] = np.fmin.reduce(obs,axis=1)
+        self.maximum[rows] = np.fmax.reduce(obs,axis=1)
+        if not res is None:
+            res = np.atleast_2d(res)
+            if include is None:
+                self.r_obs[rows] = self.total[rows]
+                r_res = res
+            else:
+                self.r_obs[rows] = np.nansum(np.where(include,obs,0),axis=1,dtype='float64')
+                r_res = np.where(include,res,0)
+            self.r_res[rows] = np.nansum(np.abs(r_res),axis=1,dtype='float64')
+        self._addPoints(obs,1)
+
+    def _addPoints(self, obs, sign):
+        """Add (sign 1) or remove (sign -1) the positive values of the (frames, points) obs from the per point sums"""
+        positive = obs>0
+        values = np.where(positive,obs,0).astype('float64')
+        self.point_total += sign*values.sum(axis=0)
+        self.point_count += sign*np.count_nonzero(positive,axis=0)
+
+    def head(self, k):
+        """Return the statistics of the first k frames - the per frame arrays are views, the per point arrays are shared"""
+        statistics = PatternStatistics.fromArrays(self.arrays())
+        for name in self.FRAME_FIELDS:
+            setattr(statistics,name,getattr(self,name)[:k])
+        return statistics
+
+    def splice(self, changed, other, replaced):
+        """
+        Replace the frames in changed by the first frames of other and append the remaining frames, see spliceFrames.
+        replaced are the observed patterns of the changed frames before they are replaced. Changes the statistics in place and returns them
+        """
+        n = len(changed)
+        if n>0:
+            self._addPoints(np.atleast_2d(replaced),-1)
+        for name in self.FRAME_FIELDS:
+            setattr(self,name,spliceFrames(getattr(self,name),changed,getattr(other,name)))
+        for name in self.POINT_FIELDS:
+            getattr(self,name)[:] += getattr(other,name)
+        return self
+
+    def arrays(self):
+        """Return a dictionary of the arrays of the statistics, see fromArrays"""
+        return {name:getattr(self,name) for name in self.__slots__}
+
+    def parameters(self):
+        """Return the per frame parameters derived from the statistics - 'Mean intensity', and 'R_p' if the frames have residuals"""
+        param = {}
+        with np.errstate(invalid='ignore',divide='ignore'): # frames without points are NaN
+            if not np.all(np.isnan(self.r_res)):
+                param['R_p'] = (self.r_res/self.r_obs*100).astype('float32')
+            param['Mean intensity'] = (self.total/self.count).astype('float32')
+        return param
+
+    def mean(self):
+        """Return the mean of the positive values of each point over the frames - NaN for points without positive values"""
+        with np.errstate(invalid='ignore',divide='ignore'):
+            return (self.point_total/self.point_count).astype('float32')
+
+def isMemoryMapped(a):
+    """Return True if the array a, or the array it is a view of, is memory-mapped from a file"""
+    while isinstance(a,np.ndarray):
+        if isinstance(a,np.memmap):
+            return True
+        a = a.base
+    return False
+
+def placeholder(row, frames):
+    """
+    Return a read-only (frames, points) array repeating row for every frame without copying it.
+    Stands in for channels that are constant over the frames, e.g. absent channels filled with zeros
+    """
+    return np.broadcast_to(row,(frames,)+np.shape(row))
+
+def isPlaceholder(a):
+    """Return True if a is a placeholder, see placeholder"""
+    return isinstance(a,np.ndarray) and a.ndim>1 and a.strides[0]==0
+
+def isAbsent(a):
+    """Return True if a is a placeholder of zeros, i.e. a channel the files did not have"""
+    return isPlaceholder(a) and not np.any(a[0])
+
+def heldBytes(a):
+    """Return the number of bytes of memory held by the array a - the row of a placeholder is only counted once"""
+    return a.itemsize*int(np.prod([n for n, stride in zip(a.shape,a.strides) if stride!=0]))
+
+def spliceFrames(a, changed, b, directory=None):
+    """
+    Return a with the frames (rows) in changed replaced by the first frames of b and the remaining frames of b appended,
+    see appendFrames. The frames of a are replaced in place. A placeholder stays a placeholder if b is a placeholder of the same row, otherwise it is replaced by a real array.
+    """
+    n = len(changed)
+    frames = a.shape[0]+b.shape[0]-n
+    if isPlaceholder(a) and isPlaceholder(b) and np.array_equal(a[0],b[0]):
+        return placeholder(a[0],frames)
+    if isPlaceholder(a):
+        row = a[0]
+        a = allocate(a.shape,a.dtype,directory)
+        a[:] = row
+    if n>0:
+        a[changed] = b[:n]
+    if b.shape[0]>n:
+        a = appendFrames(a,b[n:],directory)
+    return a
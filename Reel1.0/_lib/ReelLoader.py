@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Background loading of datasets for Reel
+"""
+import time
+import traceback
+try:
+    from PyQt5 import QtCore
+
+except ModuleNotFoundError as error:
+    if error.name in ('PyQt5'):
+        print('\n'+error.msg+'\nPlease use PIP to install: "pip install '+error.name+'"\n')
+    raise
+
+class LoadThread(QtCore.QThread):
+    """
+    Run function(*args, progress=thread) in a separate thread and emit the return value with sigFinished.
+    The thread stands in for a QProgressDialog in the function (setValue, setRange, setLabelText and wasCanceled),
+    and forwards the progress to the main thread with signals.
+    The function can pass the frames read so far to setPartial when partialDue returns True - at most every interval (ms),
+    and not before the previous frames have been shown (see partialShown).
+    """
+
+    sigValue = QtCore.pyqtSignal(int)
+    sigRange = QtCore.pyqtSignal(int,int)
+    sigLabel = QtCore.pyqtSignal(str)
+    sigPartial = QtCore.pyqtSignal(object)
+    sigFinished = QtCore.pyqtSignal(object)
+    sigFailed = QtCore.pyqtSignal(str)
+
+    def __init__(self,function,args,interval=0,parent=None):
+        QtCore.QThread.__init__(self,parent)
+        self.function = function
+        self.args = args
+        self.canceled = False
+        self.interval = interval/1000
+        self.partial_time = time.time()
+        self.partial_busy = False
+
+    def run(self):
+        try:
+            result = self.function(*self.args,progress=self)
+        except Exception:
+            self.sigFailed.emit(traceback.format_exc())
+        else:
+            self.sigFinished.emit(result)
+
+    def cancel(self):
+        self.canceled = True
+
+    def wasCanceled(self):
+        return self.canceled
+
+    def setValue(self,value):
+        self.sigValue.emit(int(value))
+
+    def setRange(self,minimum,maximum):
+        self.sigRange.emit(int(minimum),int(maximum))
+
+    def setLabelText(self,label):
+        self.sigLabel.emit(label)
+
+    def partialDue(self):
+        return self.interval > 0 and not self.partial_busy and time.time()-self.partial_time >= self.interval
+
+    def setPartial(self,result):
+        self.partial_busy = True
+        self.sigPartial.emit(result)
+
+    def partialShown(self):
+        self.partial_time = time.time()
+        self.partial_busy = False
+
+class NoProgress:
+    """
+    Stands in for a QProgressDialog in the open* methods when no progress is shown,
+    e.g. for files that are already read (see mainWindow.appendWatchedFiles)
+    """
+
+    def setValue(self,value):
+        pass
+
+    def setRange(self,minimum,maximum):
+        pass
+
+    def setLabelText(self,label):
+        pass
+
+    def wasCanceled(self):
+        return False
@@ -4,9 +4,12 @@ Last update: 30/11/2021
 Frederik H. Gjørup
 """
 import os
+import tempfile
+import weakref
+from collections import OrderedDict
 try:
     import numpy as np
-    from scipy.interpolate import griddata
+    from scipy.interpolate import LinearNDInterpolator
 except ModuleNotFoundError as error:
     if error.name in ('numpy','scipy'):
         print('\n'+error.msg+'\nPlease use PIP to install: "pip install '+error.name+'"\n')
@@ -44,6 +47,24 @@ def findFiles(path,extension='.dat'):
     files.sort()
     return files
 
+def findNewFiles(files):
+    """Return files in the folder of the last file with the same extension, sorting after the last file"""
+    path, last = os.path.split(files[-1])
+    extension = os.path.splitext(last)[1]
+    known = set(os.path.basename(f) for f in files)
+    return [f for f in findFiles(path,extension) if os.path.basename(f)>last and not os.path.basename(f) in known]
+
+def fileStats(files):
+    """Return list of (size, modification time) for each file - None for missing files"""
+    stats = []
+    for f in files:
+        try:
+            st = os.stat(f)
+            stats.append((st.st_size,st.st_mtime_ns))
+        except OSError:
+            stats.append(None)
+    return stats
+
 def commonName(names):
     """return common name from list of names"""
     name = names[0]
@@ -56,32 +77,171 @@ def commonName(names):
     return name
 
 def scaleArray(a,scale='linear',retain_sign=False):
-        if scale == 'linear' or np.all(a==0.0):
+        """Return a scaled copy of a, or a itself if the scale is linear. Zeros are kept as zeros"""
+        if scale == 'linear' or not np.any(a):
             return a
-        sign = np.sign(a)
-        a = np.abs(a)
+        # scale one copy in place
+        b = np.abs(a)
         if scale == 'log10':
-            a = np.log10(a,where=a!=0)
+            np.log10(b,where=b!=0,out=b)
         elif scale == 'logn':
-            a = np.log(a,where=a!=0)
+            np.log(b,where=b!=0,out=b)
         elif scale == 'sqrt':
-            a = np.sqrt(a,where=a!=0)
+            np.sqrt(b,where=b!=0,out=b)
         if retain_sign:
-            a *= sign
-        return a
+            np.negative(b,where=a<0,out=b)
+        return b
+
+def chunkRows(a,nbytes=2**26):
+    """Return slices of the first axis of a, each covering about nbytes of a, to process large (memory-mapped) arrays in chunks"""
+    rows = max(1,int(nbytes//max(1,a.itemsize*np.prod(a.shape[1:]))))
+    return [slice(i,min(i+rows,a.shape[0])) for i in range(0,a.shape[0],rows)]
+
+def allocate(shape, dtype, directory=None, fill=0):
+    """
+    Return a new array of shape filled with fill, memory-mapped to a temporary file in directory if it is not None.
+    The file is removed when the array is freed.
+    """
+    if directory is None:
+        return np.zeros(shape,dtype=dtype) if fill == 0 else np.full(shape,fill,dtype=dtype)
+    os.makedirs(directory,exist_ok=True)
+    a = np.memmap(tempfile.TemporaryFile(dir=directory),dtype=dtype,mode='w+',shape=tuple(shape))
+    if fill != 0:
+        a.fill(fill)
+    return a
+
+_buffers = weakref.WeakValueDictionary() # arrays with spare frames allocated by appendFrames, by id
+
+def frameBuffer(a):
+    """Return the array with spare frames that a is the first frames of, if a was returned by appendFrames, otherwise a"""
+    base = a.base
+    if (not base is None and _buffers.get(id(base)) is base and base.shape[1:] == a.shape[1:] and base.strides == a.strides
+            and base.__array_interface__['data'][0] == a.__array_interface__['data'][0]):
+        return base
+    return a
+
+def appendFrames(a, b, directory=None):
+    """
+    Return the frames (rows) of a followed by the frames of b, as the first frames of an array with spare frames.
+    The frames of b are written into the spare frames after a if there is room, otherwise an array with room for twice
+    as many frames is allocated (memory-mapped to a temporary file in directory if it is not None), so appending frames
+    one by one copies each frame a constant number of times on average. Only append to the latest array returned
+    """
+    n, k = a.shape[0], b.shape[0]
+    full = frameBuffer(a)
+    if full is a or full.shape[0] < n+k or full.dtype != np.result_type(a,b):
+        full = allocate((max(2*n,n+k),)+a.shape[1:],np.result_type(a,b),directory)
+        full[:n] = a
+        _buffers[id(full)] = full
+    full[n:n+k] = b
+    return full[:n+k]
+
+def minMaxDecimate(a,axis):
+    """
+    Return the 2D array a halved along axis by min/max decimation - every block of four values becomes its minimum and maximum,
+    so narrow peaks do not vanish. Processed in chunks of rows, so large (memory-mapped) arrays are not read at once
+    """
+    def minMax(b):
+        if b.shape[axis]%4:
+            pad = [(0,0),(0,0)]
+            pad[axis] = (0,-b.shape[axis]%4)
+            b = np.pad(b,pad,mode='edge')
+        parts = [b[j::4] if axis == 0 else b[:,j::4] for j in range(4)]
+        shape = list(parts[0].shape)
+        shape[axis] *= 2
+        c = np.empty(shape,dtype=b.dtype)
+        low, high = (c[0::2], c[1::2]) if axis == 0 else (c[:,0::2], c[:,1::2])
+        np.fmin(np.fmin(parts[0],parts[1],out=low),np.fmin(parts[2],parts[3]),out=low)
+        np.fmax(np.fmax(parts[0],parts[1],out=high),np.fmax(parts[2],parts[3]),out=high)
+        return c
+    if axis == 0:
+        # chunks of whole blocks of four rows
+        chunks = [slice(4*s.start,4*s.stop) for s in chunkRows(a[::4],2**24)]
+    else:
+        chunks = chunkRows(a)
+    return np.concatenate([minMax(a[s]) for s in chunks] or [minMax(a)])
+
+def decimationPyramid(a,size=512,previous=None):
+    """
+    Return a list of ever coarser versions of the 2D array a, starting with a itself.
+    Each is the previous one halved by minMaxDecimate along the axes longer than size, until no axis is longer than size.
+    previous is the pyramid of the first rows of a, if rows were appended to it - only the new rows are then decimated
+    and appended to its versions (see appendFrames), as long as the same axes are halved
+    """
+    levels = [a]
+    if not previous is None:
+        start = previous[0].shape[0] # the first row that is not in the previous version
+    while max(a.shape) > size:
+        axes = [axis for axis in (1,0) if a.shape[axis] > size]
+        k = len(levels)
+        if not previous is None and len(previous) > k and previous[k-1].shape[1] == a.shape[1] \
+                and (previous[k].shape[0] < previous[k-1].shape[0]) == (0 in axes):
+            # decimate again from the last, possibly partial, block of rows of the previous version
+            if 0 in axes:
+                start = start//4*4
+            new = a[start:]
+            for axis in axes:
+                new = minMaxDecimate(new,axis)
+            if 0 in axes:
+                start //= 2
+            a = appendFrames(previous[k][:start],new)
+        else:
+            previous = None
+            for axis in axes:
+                a = minMaxDecimate(a,axis)
+        levels.append(a)
+    return levels
+
+class LRUCache:
+    """Values computed by key, limited to limit bytes - the least recently used values are dropped first"""
+
+    def __init__(self,limit):
+        self.limit = limit
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+
+    def get(self,key,compute,size=lambda value: value.nbytes):
+        """Return the value of key, computed with compute() if it is not cached. size(value) is the number of bytes it holds"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = compute()
+        nbytes = size(value)
+        if nbytes <= self.limit:
+            self.entries[key] = value
+            self.sizes[key] = nbytes
+            self.size += nbytes
+            while self.size > self.limit:
+                key, _ = self.entries.popitem(last=False)
+                self.size -= self.sizes.pop(key)
+        return value
+
+    def pop(self,key):
+        """Remove the value of key and return it, or None if it is not cached"""
+        if not key in self.entries:
+            return None
+        self.size -= self.sizes.pop(key)
+        return self.entries.pop(key)
+
+    def discard(self,match=lambda key: True):
+        """Drop the values of the keys for which match(key) is True - all by default"""
+        for key in [key for key in self.entries if match(key)]:
+            del self.entries[key]
+            self.size -= self.sizes.pop(key)
 
 def centerCorrection(r, eta, x_corr, y_corr):
-    """Correct detector center offset"""
+    """Correct detector center offset - r and eta are broadcast against each other"""
     # Geometry correction
-    # Pixel position
-    p = np.array([np.cos(eta*np.pi/180)*r,np.sin(eta*np.pi/180)*r])
-    # x/y center correction
-    xy_corr = np.array([x_corr,y_corr])
+    # Pixel position relative to the x/y center correction
+    dx = np.cos(eta*np.pi/180)*r-x_corr
+    dy = np.sin(eta*np.pi/180)*r-y_corr
     # Corrected azimuthal radius
-    r_corr = np.array([np.linalg.norm(p_i-xy_corr) for p_i in p.T])
+    r_corr = np.sqrt(dx*dx+dy*dy)
     return r_corr
 
-def gridInterpolation(r,I,eta,x_corr,y_corr,dist,length,xi=None,yi=None,mask=None):
+
+def gridInterpolation(r,I,eta,x_corr,y_corr,dist,length,xi=None,yi=None,mask=None,engine='auto'):
     """
     Interpolate z data from old unstructured x/y coordinates to new equidistant grid coordinates
         return
@@ -90,35 +250,64 @@ def gridInterpolation(r,I,eta,x_corr,y_corr,dist,length,xi=None,yi=None,mask=Non
             zi   - (n,m) array - interpolated z values 
             mask - (n,m) array - boolean mask based on "original" x/y ranges
     """
+    xi, yi, zi, mask = gridInterpolationChannels(r,[I],eta,x_corr,y_corr,dist,length,xi,yi,mask,engine)
+    return xi, yi, zi[0], mask
+
+
+def gridInterpolationChannels(r,channels,eta,x_corr,y_corr,dist,length,xi=None,yi=None,mask=None,engine='auto'):
+    """
+    Interpolate several channels of z data sampled at the same unstructured x/y coordinates to new equidistant grid coordinates.
+    The interpolation geometry is computed once and shared by all channels.
+        engine - 'griddata': 2D linear interpolation across all eta sectors (Delaunay triangulation)
+                 'rows'    : 1D linear interpolation of each eta sector onto its own row of the grid
+                 'auto'    : 'rows' if the grid rows coincide with the eta sectors, otherwise 'griddata'
+        return
+            xi   -  (m,) array - grid x coordinates 
+            yi   -  (n,) array - grid y coordinates 
+            zi   - list of (n,m) arrays - interpolated z values of each channel
+            mask - (n,m) array - boolean mask based on "original" x/y ranges
+    """
     # Flatten to 1D arrays
-    x = np.concatenate(r)
-    y = np.concatenate([[eta[i]]*l.shape[0] for i,l in enumerate(r)])
-    z = np.concatenate(I)
-
-    # Correct for detector center offset
-    x = centerCorrection(x, y, x_corr, y_corr)
-    # Convert to 2 theta
-    x = np.arctan(x/dist)*180/np.pi
-    # Determine tth range
-    tth_range = [r2tth(centerCorrection(np.array([ri[0],ri[-1]]), eta[i], x_corr, y_corr),dist) for i, ri in enumerate(r)]
+    lengths = [l.shape[0] for l in r]
+    y = np.repeat(np.asarray(eta,dtype=float),lengths)
+    z = np.column_stack([np.concatenate(I) for I in channels]).astype('float64',copy=False)
+    # Correct for detector center offset and convert to 2 theta
+    x = r2tth(centerCorrection(np.concatenate(r), y, x_corr, y_corr),dist)
+    # Determine tth range of each sector from its first and last point
+    last = np.cumsum(lengths)-1
+    tth_range = np.column_stack((x[last-np.array(lengths)+1],x[last]))
     
     # Create equidistant grid values
     if isinstance(xi,type(None)):
         xi = np.linspace(x.min(), x.max(), length)
     if isinstance(yi,type(None)):
         yi = np.linspace(y.min(), y.max(), len(eta))
-    Xi, Yi = np.meshgrid(xi,yi)
     # Create mask based on "original" 2theta range
     if isinstance(mask,type(None)):
-        mask = np.full(Xi.shape,False, dtype=bool)
-        for i, row in enumerate(Xi):
-            mask[i,:][row<tth_range[i][0]] = True
-            mask[i,:][row>tth_range[i][1]] = True
+        mask = (xi<tth_range[:,:1]) | (xi>tth_range[:,1:])
     
-    # interpolate z data from old unstructured x/y coordinates to new equidistant grid coordinates
-    zi = griddata((x,y), z, (Xi, Yi), method='linear')
-    zi[mask]=np.nan
-    return xi, yi, zi, mask
+    if engine == 'auto':
+        engine = 'rows' if len(yi)==len(eta) and np.allclose(yi,eta) else 'griddata'
+    if engine == 'rows':
+        # interpolate each sector onto its own row of the grid
+        zi = np.full((z.shape[1],len(yi),xi.shape[0]),np.nan)
+        start = 0
+        for i, n in enumerate(lengths):
+            xs, zs = x[start:start+n], z[start:start+n]
+            start += n
+            if np.any(xs[1:]<xs[:-1]):
+                order = np.argsort(xs,kind='stable')
+                xs, zs = xs[order], zs[order]
+            for k in range(z.shape[1]):
+                zi[k,i] = np.interp(xi, xs, zs[:,k], left=np.nan, right=np.nan)
+    else:
+        # interpolate z data from old unstructured x/y coordinates to new equidistant grid coordinates
+        # - same as scipy.interpolate.griddata(method='linear') for each channel
+        Xi, Yi = np.meshgrid(xi,yi)
+        zi = LinearNDInterpolator(np.column_stack((x,y)), z)(Xi, Yi)
+        zi = np.moveaxis(zi,-1,0).copy() # (channels, n, m)
+    zi[:,mask]=np.nan
+    return xi, yi, list(zi), mask
 
 
 def generateTicks(x):
@@ -5,7 +5,7 @@ Frederik H. Gjørup
 """
 import os
 try:
-    from PyQt5 import QtCore, QtGui
+    from PyQt5 import QtCore, QtGui, QtWidgets
     import pyqtgraph as pg
     import numpy as np
     from matplotlib import cm
@@ -17,7 +17,7 @@ except ModuleNotFoundError as error:
         print('\n'+error.msg+'\nPlease use PIP to install\n')
     raise
 
-from _lib.ReelMisc import roundup
+from _lib.ReelMisc import roundup, decimationPyramid
 from _lib.AUColors import AUlight, getColor
 import ReelUserSettings as us
 
@@ -27,6 +27,12 @@ def convertColormapMPtoPG(cmap):
     colors = [tuple(color*255) for color in cmap(pos)]
     return pg.ColorMap(pos=pos,color=colors)
 
+def decimatePlot(item):
+    """Draw only the visible part of a PlotDataItem, reduced to the min and max of a few points per screen pixel"""
+    item.setClipToView(True)
+    item.setDownsampling(auto=True,method='peak')
+    return item
+
 class MultiImageWidget(pg.GraphicsLayoutWidget):
     
     sigHLineDragged = QtCore.pyqtSignal(object)
@@ -49,7 +55,14 @@ class MultiImageWidget(pg.GraphicsLayoutWidget):
         yax.showLabel(True)
         self.addItem(yax)
         #Create imageItems
-        self.images = [pg.ImageItem(border='w', axisOrder='row-major') for i in range(n_images)]
+        self.images = [pg.ImageItem(axisOrder='row-major') for i in range(n_images)]
+        #Outline the full extent of each image - the images may be cropped, see setData
+        self.outlines = [QtWidgets.QGraphicsRectItem() for i in range(n_images)]
+        [outline.setPen(pg.mkPen('w')) for outline in self.outlines]
+        #Decimation pyramid, extent and drawn (level, rows, columns) of each image, see setData
+        self._levels = [[] for i in range(n_images)]
+        self._extents = [None]*n_images
+        self._shown = [None]*n_images
         # transform image origin
         tr = QtGui.QTransform()
         tr.translate(0,0.5)
@@ -79,6 +92,7 @@ class MultiImageWidget(pg.GraphicsLayoutWidget):
         for i,v in enumerate(self.views):
             v.setAspectLocked(False)
             v.addItem(self.images[i])
+            v.addItem(self.outlines[i])
             v.linkView(v.XAxis,self.views[0])
             v.linkView(v.YAxis,self.views[0])           
             v.setLimits(xMin=-5, 
@@ -94,12 +108,16 @@ class MultiImageWidget(pg.GraphicsLayoutWidget):
             else:
                 data = data-0.5
                 self.images[i].setImage(data)
+            self.outlines[i].setRect(self.images[i].mapRectToParent(self.images[i].boundingRect()))
             
             #Add movable horizontal and vertical lines for data slicing
             v.addItem(self.hlines[i])
             v.addItem(self.vlines[i])
             self.hlines[i].sigDragged.connect(self._update_hline)
             self.vlines[i].sigDragged.connect(self._update_vline)       
+            #Draw the version of the image matching the view, see setData
+            v.sigRangeChanged.connect(lambda *args, i=i: self._showLevel(i))
+            v.sigResized.connect(lambda *args, i=i: self._showLevel(i))
             
         self.nextRow()
         
@@ -173,9 +191,21 @@ class MultiImageWidget(pg.GraphicsLayoutWidget):
         _,level = self.hist_2.getLevels()
         self.hist_2.setHistogramRange(-level,level)
     
-    def setData(self,index, im):
-        yMax, xMax = im.shape
-        self.images[index].setImage(im)
+    def setData(self,index, im, rows=None, levels=None):
+        """
+        Show im in image index - stretched over rows rows, e.g. when only every n'th row of the data is shown.
+        levels are the coarser versions of im from decimationPyramid, computed if not given. The coarsest version
+        that still has a pixel for every screen pixel of the view is drawn, so large images are only drawn in full when zoomed in
+        """
+        yMax, xMax = im.shape[0] if rows is None else rows, im.shape[1]
+        self._levels[index] = [im]+list(decimationPyramid(im)[1:] if levels is None else levels)
+        self._extents[index] = (yMax,xMax)
+        self._shown[index] = None
+        # the color levels are set from the coarsest version - it keeps the minimum and maximum of im
+        self.images[index].setImage(self._levels[index][-1])
+        # frame j is drawn at j+0.5 to j+1.5, centred on the cursor position j+1 of the frame
+        self.images[index].setRect(QtCore.QRectF(0,0.5,xMax,yMax))
+        self.outlines[index].setRect(QtCore.QRectF(0,0.5,xMax,yMax))
         self.views[index].setLimits(xMin=-5, xMax=xMax+5,
                                     minXRange=10, 
                                     yMin=-2, yMax=yMax+2,
@@ -183,6 +213,46 @@ class MultiImageWidget(pg.GraphicsLayoutWidget):
         self.views[index].autoRange()
         [h.setBounds((-1,yMax+1)) for h in self.hlines]
         [v.setBounds((-1,xMax+1)) for v in self.vlines]
+        self._showLevel(index)
+
+    def _showLevel(self,index):
+        """
+        Draw the coarsest version of image index with at least one pixel per screen pixel of the view,
+        cropped to the visible part and a margin of half the view on each side
+        """
+        levels, view = self._levels[index], self.views[index]
+        if len(levels)<1:
+            return
+        yMax, xMax = self._extents[index]
+        rect = view.viewRect()
+        ratio = self.devicePixelRatioF()
+        pixels = (view.height()*ratio, view.width()*ratio)
+        # rows of the image, which is drawn half a row up, see setData
+        visible = ((rect.top()-0.5,rect.bottom()-0.5), (rect.left(),rect.right()))
+        full = levels[0].shape
+        for k in range(len(levels)-1,-1,-1):
+            shape = levels[k].shape
+            # an axis of a version is fine enough if it is not decimated or has a pixel per screen pixel
+            if all(n == n_full or (high-low)*n/extent >= p for n, n_full, (low,high), extent, p
+                   in zip(shape,full,visible,(yMax,xMax),pixels)):
+                break
+        a = levels[k]
+        inner, outer = [], []
+        for (low,high), n, extent in zip(visible,a.shape,(yMax,xMax)):
+            low, high = low*n/extent, high*n/extent
+            margin = (high-low)/2
+            inner.append((max(0,int(low)),min(n,int(np.ceil(high)))))
+            outer.append((max(0,int((low-margin)//64*64)),min(n,int(-((-high-margin)//64)*64))))
+        shown = self._shown[index]
+        if not shown is None and shown[0] == k and all(s[0]<=i[0] and i[1]<=s[1] for s, i in zip(shown[1:],inner)):
+            return
+        (y0,y1), (x0,x1) = outer
+        if y1<=y0 or x1<=x0:
+            return
+        self._shown[index] = (k,(y0,y1),(x0,x1))
+        rows, cols = a.shape
+        self.images[index].setImage(a[y0:y1,x0:x1],autoLevels=False)
+        self.images[index].setRect(QtCore.QRectF(x0*xMax/cols,0.5+y0*yMax/rows,(x1-x0)*xMax/cols,(y1-y0)*yMax/rows))
 
     def autoRangeHistograms(self):
         self._setLinearRange()
@@ -291,9 +361,9 @@ class PlotPatternWidget(pg.PlotWidget):
         self.legend = self.addLegend()
         self.setLimits(xMin=0, xMax=180)
         #Add plots
-        self.pobs = self.plot(x=[0],y=[0], name='Observed', pen=None, symbol='o', symbolPen='r', symbolSize=2)
-        self.pcal = self.plot(x=[0],y=[0], name='Calculated')
-        self.pres = self.plot(x=[0],y=[0], name='Residual', pen=pg.mkPen(color=(0,0,255), width=0.5))
+        self.pobs = decimatePlot(self.plot(x=[0],y=[0], name='Observed', pen=None, symbol='o', symbolPen='r', symbolSize=2))
+        self.pcal = decimatePlot(self.plot(x=[0],y=[0], name='Calculated'))
+        self.pres = decimatePlot(self.plot(x=[0],y=[0], name='Residual', pen=pg.mkPen(color=(0,0,255), width=0.5)))
         
         self.psub = {}
     
@@ -324,7 +394,7 @@ class PlotPatternWidget(pg.PlotWidget):
             self._getColors(exclude=('red','blue','gray'))
             color = self.colors.pop(0)
         pen = pg.mkPen(color=color, style=QtCore.Qt.DashLine)
-        self.psub[key]=self.plot(x=[0],y=[0], name=key, pen=pen)
+        self.psub[key]=decimatePlot(self.plot(x=[0],y=[0], name=key, pen=pen))
 
     def removeSubplots(self):
         for item in self.psub.values():
@@ -335,7 +405,10 @@ class PlotPatternWidget(pg.PlotWidget):
         self.psub[key].setData(x,y)
         
     def setObsData(self,x,y):
-         self.pobs.setData(x,y)
+        #Remove NAN values - a NAN hides all points reduced to the same screen pixel
+        x = x[~np.isnan(y)]
+        y = y[~np.isnan(y)]
+        self.pobs.setData(x,y)
     
     def setCalData(self,x,y):
         #Remove NAN values 
@@ -344,7 +417,10 @@ class PlotPatternWidget(pg.PlotWidget):
         self.pcal.setData(x,y)    
         
     def setResData(self,x,y):
-         self.pres.setData(x,y)
+        #Remove NAN values 
+        x = x[~np.isnan(y)]
+        y = y[~np.isnan(y)]
+        self.pres.setData(x,y)
          
     def setMouseModes(self,mode=None):
         vb = self.getViewBox()
@@ -385,9 +461,9 @@ class PlotSliceWidget(pg.PlotWidget):
         self.addLegend()
         self.setLimits(xMin=0)
         #Add plots
-        self.pobs = self.plot(x=[0],y=[0], name='Observed', pen=None, symbol='o', symbolPen='r', symbolSize=2)
-        self.pcal = self.plot(x=[0],y=[0], name='Calculated')
-        self.pres = self.plot(x=[0],y=[0], name='Residual', pen=pg.mkPen(color='b', width=0.5))
+        self.pobs = decimatePlot(self.plot(x=[0],y=[0], name='Observed', pen=None, symbol='o', symbolPen='r', symbolSize=2))
+        self.pcal = decimatePlot(self.plot(x=[0],y=[0], name='Calculated'))
+        self.pres = decimatePlot(self.plot(x=[0],y=[0], name='Residual', pen=pg.mkPen(color='b', width=0.5)))
         
         self.psub = {}
         
@@ -405,7 +481,7 @@ class PlotSliceWidget(pg.PlotWidget):
             self._getColors(exclude=('red','blue','gray'))
             color = self.colors.pop(0)
         pen = pg.mkPen(color=color, style=QtCore.Qt.DashLine)
-        self.psub[key]=self.plot(x=[0],y=[0], name=key, pen=pen)
+        self.psub[key]=decimatePlot(self.plot(x=[0],y=[0], name=key, pen=pen))
 
     def removeSubplots(self):
         for item in self.psub.values():
@@ -500,75 +576,58 @@ class PlotParametersWidget(pg.PlotWidget):
             
         self.symbolList = ['o','s','t','d','+'] # Symbols:  * ‘o’ circle (default) * ‘s’ square * ‘t’ triangle * ‘d’ diamond * ‘+’ plus *
             
-    def addPrimaryPlot(self,key):
+    def makePlot(self,key,x,y,secondary=False):
+        """Return a plot of the parameter key with the style of key, to be shown with setPlots"""
         label, pen, color, symbol, symbolSize = self._getStyle(key)
-        self.p0[key]=self.pI.plot(x=[0], 
-                                  y=[0],
-                                  name='← '+label,
-                                  pen=pen,
-                                  symbol=symbol,
-                                  symbolPen=color,
-                                  symbolBrush=color,
-                                  symbolSize=symbolSize)
+        # no dynamic range limit - the symbols are otherwise drawn again whenever the plot is shown or the view changes
+        return pg.PlotDataItem(x=x,
+                               y=y,
+                               name=label+' →' if secondary else '← '+label,
+                               pen=pen,
+                               symbol=symbol,
+                               symbolPen=color,
+                               symbolBrush=color,
+                               symbolSize=symbolSize,
+                               dynamicRangeLimit=None)
 
-    def addSecondaryPlot(self,key):
-        label, pen, color, symbol, symbolSize = self._getStyle(key)
-        self.p1[key] = pg.PlotDataItem(x=[0],
-                                       y=[0], 
-                                       name=label+' →',
-                                       pen=pen,
-                                       symbol=symbol,
-                                       symbolPen=color,
-                                       symbolBrush=color,
-                                       symbolSize=symbolSize)
-        self.v2.addItem(self.p1[key])
-        
     ## Handle view resizing 
     def _updateViews(self):
         ## view has resized; update auxiliary views to match
         self.v2.setGeometry(self.pI.vb.sceneBoundingRect())
         self.v2.linkedViewChanged(self.pI.vb, self.v2.XAxis)
         
-    def clearPlot(self):
-        for key in self.p0:
-            self.p0[key].setData([-1],[-1])
-        for key in self.p1:
-            self.p1[key].setData([-1],[-1])
-        self.legend.clear()
-    
-    def removePrimaryPlots(self):
+    def setPlots(self,primary,secondary):
+        """Show the plots in the dictionaries primary and secondary (see makePlot) on the left and right axis, instead of the current plots"""
         for item in self.p0.values():
             self.pI.removeItem(item)
-        self.p0 = {}
-    
-    def removeSecondaryPlots(self):
         for item in self.p1.values():
             self.v2.removeItem(item)
-        self.p1 = {}
-            
-    def setPrimaryData(self,key,x,y):
-        p = self.p0[key]
-        self.legend.addItem(p, p.name())
-        p.setData(x,y)
-        yMax = roundup(np.abs(y).max())
-        if yMax < 1:
-            yMax = 1.0
-        self.setLimits(xMin=-2, xMax=len(x)+2,
-               yMin=-yMax, yMax=yMax*2)
-        self.vline.setBounds((-1,len(x)+1))
-        self.autoRange()
-    
-    def setSecondaryData(self,key,x,y):
-        p = self.p1[key]
-        self.legend.addItem(p, p.name())
-        self.pI.showAxis('right',show=True)
-        p.setData(x,y)
-        yMax = roundup(np.abs(y).max())
-        if yMax < 1:
-            yMax = 1.0
-        self.v2.setLimits(xMin=-2, xMax=len(x)+2,
-               yMin=-yMax, yMax=yMax*2)
-        self.v2.autoRange()
+        self.p0, self.p1 = primary, secondary
+        for p in primary.values():
+            self.pI.addItem(p)
+        for p in secondary.values():
+            self.v2.addItem(p)
+        self.legend.clear()
+        for p in primary.values():
+            self.legend.addItem(p, p.name())
+            x, y = p.getData()
+            yMax = roundup(np.abs(y).max())
+            if yMax < 1:
+                yMax = 1.0
+            self.setLimits(xMin=-2, xMax=len(x)+2,
+                   yMin=-yMax, yMax=yMax*2)
+            self.vline.setBounds((-1,len(x)+1))
+            self.autoRange()
+        for p in secondary.values():
+            self.legend.addItem(p, p.name())
+            self.pI.showAxis('right',show=True)
+            x, y = p.getData()
+            yMax = roundup(np.abs(y).max())
+            if yMax < 1:
+                yMax = 1.0
+            self.v2.setLimits(xMin=-2, xMax=len(x)+2,
+                   yMin=-yMax, yMax=yMax*2)
+            self.v2.autoRange()
             
     def updateVline(self,pos):
         self.vline.setValue(pos)
@@ -3,22 +3,88 @@
 Last update: 26/11/2021
 Frederik H. Gjørup
 """
+import io
+import os
+import re
+import sys
+import mmap
+import locale
+import warnings
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 try:
     import numpy as np
 except ModuleNotFoundError as error:
     if error.name in ('numpy'):
         print('\n'+error.msg+'\nPlease use PIP to install: "pip install '+error.name+'"\n')
+from _lib.ReelMisc import gridInterpolation, gridInterpolationChannels
 
-def readXYY(fname):
-    """Read *.xyy files from TOPAS parametric refinement. Return header and parameter dictionaries"""
-    line=''
-    header = []
+_executor = None # Shared pool of worker processes, see readFiles()
+_workers = 0 # Number of worker processes of _executor
+_futures = set() # Work submitted to _executor that is not done yet, see shutdownExecutor()
+_C_LOADTXT = np.lib.NumpyVersion(np.__version__) >= '1.23.0' # np.loadtxt is implemented in C from numpy 1.23
+_SHUTDOWN_WAIT = sys.version_info < (3,9) # before Python 3.9, a pool shut down without waiting can hang at exit
+
+def parseNumeric(text, ncols=None, dtype='float64'):
+    """
+    Parse a block of whitespace separated numbers in a single pass. Text following # is ignored.
+    Return (rows, ncols) array - the number of columns is taken from the first line if not given.
+    ncols=0 returns all values as a flat array, regardless of line breaks.
+    Raise ValueError for non-numeric entries or incomplete rows.
+    """
+    if not text.strip():
+        return np.empty((0,ncols or 0),dtype=dtype)
+    if _C_LOADTXT and ncols != 0:
+        a = np.loadtxt(io.StringIO(text),dtype=dtype,ndmin=2)
+        if not ncols is None and a.shape[1] != ncols:
+            raise ValueError('Expected {} columns, found {}'.format(ncols,a.shape[1]))
+        return a
+    # np.fromstring tokenizes in C, unlike np.loadtxt before numpy 1.23
+    if '#' in text:
+        text = re.sub('#[^\n]*', '', text)
+    if ncols is None:
+        ncols = len(text.lstrip().split('\n',1)[0].split())
+    with warnings.catch_warnings():
+        # older versions of numpy only warn about unparsable data
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            a = np.fromstring(text, dtype='float64', sep=' ')
+        except DeprecationWarning as error:
+            raise ValueError(str(error))
+    if ncols == 0:
+        return a.astype(dtype,copy=False)
+    if ncols < 1 or a.shape[0] % ncols:
+        raise ValueError('Unable to parse {} values as rows of {} columns'.format(a.shape[0],ncols))
+    return a.reshape(-1,ncols).astype(dtype,copy=False)
+
+
+def readXYY(fname,schema=None):
+    """
+    Read *.xyy files from TOPAS parametric refinement. Return header and parameter dictionaries
+    schema - dict describing the header layout. An empty dict is filled in from the file,
+             a filled dict (from the first file in a series) is only checked against the file.
+    """
+    header = None
     with open(fname,'r') as f:
-        while not 'END OF HEADER' in line:
-           line = f.readline() 
-           header.append(line)
-        parameters = f.readline().split()
-        data = np.loadtxt(f,dtype='float32')
+        if schema:
+            header = [f.readline() for i in range(schema['header'])]
+            parameters = f.readline().split()
+            if not 'END OF HEADER' in header[-1] or parameters != schema['columns']:
+                # different layout - read the header line by line
+                header = None
+                f.seek(0)
+        if header is None:
+            line=''
+            header = []
+            while not 'END OF HEADER' in line:
+               line = f.readline() 
+               header.append(line)
+            parameters = f.readline().split()
+            if schema == {}:
+                schema.update(header=len(header),columns=parameters)
+        data = parseNumeric(f.read(),dtype='float32')
     h = {'Filename':header[0]}
     comments = header.index('COMMENTS\n')
     h['Comments']=''.join(header[comments+1:-1])
@@ -32,42 +98,55 @@ def readXYY(fname):
     return h, dic
 
 
-def readPRF(fname):      
-    header = []
-    mask = [] #Excluded region
-    content = []
+def readPRF(fname):
+    """Read FullProf .prf file. Return 2θ, Yobs, Ycal, Yobs-Ycal, background, temperature, excluded region mask and wavelengths"""
     with open(fname) as file:
-        for i in range(3):
-            header.append(file.readline())
+        header = [file.readline() for i in range(3)]
         try:
             temp = float(header[0].split()[-1])
         except ValueError:
             temp = None
         lambd =  [float(l) for l in header[1].split()[2:4]]
-        for i in range(int(header[2].split()[-1])):
-            mask.append(file.readline().split())
+        mask = ''.join(file.readline() for i in range(int(header[2].split()[-1]))) # Excluded regions
         file.readline()
-        for i in range(int(header[1].split()[1])):
-            content.append(file.readline().split()[0:5])
-    content = np.array(content, dtype='float32')
+        n = int(header[1].split()[1])
+        lines = list(islice(file,n))
+    if len(lines) < n:
+        raise ValueError('Expected {} data points, found {}'.format(n,len(lines)))
+    try:
+        content = parseNumeric(''.join(lines))[:,:5]
+    except ValueError:
+        # ragged rows - only the first five columns are used
+        content = np.array([line.split()[0:5] for line in lines], dtype='float64')
+    if content.ndim != 2 or content.shape[1] < 5:
+        raise ValueError('Expected at least 5 columns of data')
+    content = content.astype('float32')
     
     tth = content[:,0]
     yobs = content[:,1]
     ycal = content[:,2]
     res = content[:,3]
     bckg = content[:,4]
-    mask = np.array(mask, dtype='float32')
-    if len(mask)>0:
-        excl_reg = (tth < mask[0,0]) | (tth > mask[0,1])
-    else:
-        excl_reg = np.full(tth.shape[0],True)
-    for i in mask:
-        excl_reg = ((tth < i[0]) | (tth > i[1])) & excl_reg
-    #Invert True/False
-    excl_reg = excl_reg==False
+    mask = parseNumeric(mask)[:,:2].astype('float32') if mask.strip() else np.empty((0,2),dtype='float32')
+    # a point is excluded if it falls within any of the excluded regions
+    excl_reg = np.any((tth[:,np.newaxis] >= mask[:,0]) & (tth[:,np.newaxis] <= mask[:,1]),axis=1)
     return tth, yobs, ycal, res, bckg, temp, excl_reg, lambd
 
 
+def readPrfAny(fname,schema=None):
+    """
+    Read FullProf .prf file and fall back to the Jana format. Return the readPRF values and a sub plot dictionary
+    schema - accepted for use with readFiles, the .prf header is always read
+    """
+    try:
+        tth, yobs, ycal, res, bckg, temp, excl_reg, lambd = readPRF(fname)
+        sub_plots = {}
+    except ValueError:
+        tth, yobs, ycal, res, bckg, excl_reg, sub_plots = readPrfAlt(fname)
+        temp, lambd = None, [None]
+    return tth, yobs, ycal, res, bckg, temp, excl_reg, lambd, sub_plots
+
+
 def readPrfAlt(fname):
     # Jana format
     tth, yobs, ycal, sig, tth_corr, flag, sub_plots, bckg, res = [],[],[],[],[],[],[],[],[]
@@ -90,11 +169,26 @@ def readPrfAlt(fname):
     return tth_corr[0], yobs[0], ycal[0], res[0], bckg[0], excl_reg[0], sub_plots[0]
 
 
-def readPAR(fname):
+def _parLines(mm, encoding):
+    """Generator of the lines of a memory-mapped .par file, read one at a time so that data blocks can be skipped with _parBlock"""
+    for line in iter(mm.readline, b''):
+        yield line.decode(encoding).replace('\r\n','\n')
+
+
+def _parBlock(mm, newline=b'\n'):
+    """Return the byte range (start, stop) of a memory-mapped .par file up to the next blank line and move past it"""
+    start = mm.tell()
+    end = mm.find(b'\n'+newline, start-1) # a blank line directly after the current position ends an empty block
+    if end < 0:
+        end = len(mm)-1
+    mm.seek(min(end+1+len(newline),len(mm)))
+    return start, end+1
+
+
+def indexPAR(fname):
     """
+    Read the headers of a MAUD .par file and locate the intensity blocks without parsing them
     return:
-    r           - np.array  shape: (datasets, datafiles, datapoints)
-    I           - np.array  shape: (datasets, datafiles, datapoints)
     dist        - list [float, ...]
     lambd       - list [float, ...]
     x_corr      - list [float, ...]
@@ -102,8 +196,8 @@ def readPAR(fname):
     dataset_id  - list [str, ..]
     datafile_id - list of tuple [(str,bool), ...]
     eta         - list [float, ...]
+    blocks      - list of lists [(start, stop, number of points in header, number of data points), ...] - one per datafile
     """
-    
     dataset_id = []
     datafile_id = []
     enabled = []
@@ -111,12 +205,12 @@ def readPAR(fname):
     x_corr = []
     y_corr = []
     lambd = []
-    eta = [[]]
-    r = [[[]]]
-    I = [[[]]]
-    i = 0
-    n = 0
-    with open(fname,'r') as f:
+    eta = []
+    blocks = []
+    with open(fname,'rb') as file, mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ) as mm:
+        newline = b'\r\n' if mm.readline().endswith(b'\r\n') else b'\n'
+        mm.seek(0)
+        f = _parLines(mm, locale.getpreferredencoding(False))
         for line in f: # Loop through all n datasets
             if '_pd_meas_dataset_id' in line:
                 dataset_id.append(line.split()[-1].strip("'"))
@@ -134,6 +228,7 @@ def readPAR(fname):
                     if line.startswith('_diffrn_radiation_wavelength '):
                         lambd.append(float(line.replace('(',' ').split()[1]))
                 
+                blocks_n, eta_n = [], []
                 for line in f:
                     if '#end_subordinateObject_{}\n'.format(dataset_id[-1]) in line:
                         break
@@ -146,71 +241,207 @@ def readPAR(fname):
                     if '_pd_meas_number_of_points' in line:
                         num  = int(line.split()[-1])
                     if '_pd_meas_intensity_total' in line:
-                        for line in f: # Reading observed data for each datafile
-                            if line == '\n':
-                                break 
-                            x, y, _ = [float(s) for s in line.split()]
-                            r[n][i].append(x)
-                            I[n][i].append(y)
-  
-                        eta[n].append(e)
-                        #End of datafile
-                        if num<1: # Append nan in case of an empty datafile
-                            # r[n][i].append(np.nan)
-                            # I[n][i].append(np.nan)
-                            try:
-                                rmin=np.min(r[n][0])
-                                #print(rmin)
-                            except:
-                                rmin=0.0
-                            r[n][i].append(rmin)
-                            I[n][i].append(0)
+                        # Locate observed data for each datafile
+                        start, stop = _parBlock(mm,newline)
+                        points = mm[start:stop].count(b'\n')
+                        if stop > start and mm[stop-1:stop] != b'\n':
+                            points += 1 # last line of the file
+                        eta_n.append(e)
+                        if num<1: # an empty datafile is given a single point
+                            points += 1
                             enabled[-1] = 'false' # Failsafe disabling of the corresponding .fit file
-                            
-                        if r[n][i][0]>r[n][i][-1]: # Reverse order if appropriate
-                            r[n][i].reverse()
-                            I[n][i].reverse()
-
-                        r[n][i] = np.array(r[n][i]) # Convert list to array
-                        r[n].append([]) # Append empty list for next datafile
-                        I[n].append([])
-
-                        i += 1
+                        blocks_n.append((start, stop, num, points))
                 #End of dataset
-                r[n].pop(-1) # Remove empty list when all datafiles are appended
-                r.append([[]]) # Append empty list for next dataset
-                I[n].pop(-1)            
-                I.append([[]])
-                eta.append([])
-                n += 1
-                i = 0
-    # Remove empty list when all dataset are appended            
-    r.pop(-1) 
-    I.pop(-1)
-    eta.pop(-1)
-    # Convert from list to numpy array
-    r = np.array(r,dtype=object)
-    I = np.array(I,dtype=object)
+                blocks.append(blocks_n)
+                eta.append(eta_n)
     datafile_id = [(datafile_id[i],s=='true') for i, s in enumerate(enabled)]
+    return dist, lambd, x_corr ,y_corr, dataset_id, datafile_id, eta, blocks
+
+
+def readParBlocks(fname, blocks):
+    """
+    Parse the intensity blocks of a dataset in a .par file, located by indexPAR
+    return:
+    r           - list of (datapoints,) arrays - one per datafile
+    I           - list of (datapoints,) arrays - one per datafile
+    """
+    r, I = [], []
+    with open(fname,'rb') as file, mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ) as mm:
+        for start, stop, num, _ in blocks:
+            block = parseNumeric(mm[start:stop].decode('ascii'),3)
+            r_i = block[:,0].copy()
+            I_i = block[:,1].copy()
+            if num<1: # Append nan in case of an empty datafile
+                try:
+                    rmin = np.min(r[0] if r else r_i)
+                except ValueError:
+                    rmin = 0.0
+                r_i = np.append(r_i,rmin)
+                I_i = np.append(I_i,0.0)
+            if r_i[0]>r_i[-1]: # Reverse order if appropriate
+                r_i = r_i[::-1]
+                I_i = I_i[::-1]
+            r.append(r_i)
+            I.append(I_i)
+    return r, I
+
+
+def readPAR(fname):
+    """
+    Intensity blocks are parsed in bulk from the memory-mapped file, without holding the whole file in memory
+    return:
+    r           - np.array  shape: (datasets,) - list of (datapoints,) arrays for each datafile
+    I           - np.array  shape: (datasets,) - list of (datapoints,) arrays for each datafile
+    dist        - list [float, ...]
+    lambd       - list [float, ...]
+    x_corr      - list [float, ...]
+    y_corr      - list [float, ...]
+    dataset_id  - list [str, ..]
+    datafile_id - list of tuple [(str,bool), ...]
+    eta         - list [float, ...]
+    """
+    dist, lambd, x_corr ,y_corr, dataset_id, datafile_id, eta, blocks = indexPAR(fname)
+    # Convert from list to numpy array of per-dataset lists
+    r, I = np.empty(len(blocks),dtype=object), np.empty(len(blocks),dtype=object)
+    for n, blocks_n in enumerate(blocks):
+        r[n], I[n] = readParBlocks(fname, blocks_n)
     return r, I, dist, lambd, x_corr ,y_corr, dataset_id, datafile_id, eta
     
 
-def readFIT(fname):  #,dist,x_corr,y_corr):
-    """Read *.fit file from MAUD. 2theta values are calculated from provided detector distance. Return dictionary with tth, I, and additional columns."""
-    keys = ['r','I']
+def _readFitOrNone(fname, schema):
+    """Read a .fit file with readFIT, or return None if it is missing"""
+    try:
+        return readFIT(fname,schema=schema)
+    except FileNotFoundError:
+        return None
+
+
+def readFITs(path, datafile_id, threads=1):
+    """
+    Read the .fit files of a dataset in a .par file from a list of (filename, enabled) - missing or disabled files are given a single nan point
+    threads - number of files opened concurrently, to overlap the latency of slow (e.g. network) storage
+    """
+    fnames = ['{}/{}{}.fit'.format(path,*f.split('.esg')) if enabled else None for f, enabled in datafile_id]
+    data = [None]*len(fnames)
+    schema = {} # column layout of the first .fit file
+    # Read in order until the first file is found, so the rest can be read with its schema
+    i = 0
+    while i < len(fnames) and not schema:
+        if fnames[i]:
+            data[i] = _readFitOrNone(fnames[i],schema)
+        i += 1
+    rest = [j for j in range(i,len(fnames)) if fnames[j]]
+    if threads > 1 and len(rest) > 1:
+        with ThreadPoolExecutor(max_workers=min(threads,len(rest))) as pool:
+            for j, d in zip(rest,pool.map(partial(_readFitOrNone,schema=schema),[fnames[j] for j in rest])):
+                data[j] = d
+    else:
+        for j in rest:
+            data[j] = _readFitOrNone(fnames[j],schema)
+
+    sub_plots = {}
+    r = []
+    I   = []
+    bgr = []
+    for d in data:
+        if not d is None:
+            r.append(d.pop('r'))
+            I.append(d.pop('I'))
+            bgr.append(d.pop('background'))
+            for key in d:
+                y = d[key]
+                try:
+                    sub_plots[key].append(y)
+                except KeyError:
+                    sub_plots[key]=[y]
+        else:
+            r.append(np.array([0.0]))
+            I.append(np.array([np.nan]))
+            bgr.append(np.array([np.nan]))
+            for key in sub_plots.keys():
+                sub_plots[key].append(np.array([np.nan]))
+
+    for key in sub_plots.keys():
+        sub_plots[key] = np.array(sub_plots[key],dtype=object)
+    return r, I, bgr, sub_plots
+
+
+def readParDataset(fname, path, n, header, length, engine='auto', threads=1):
+    """
+    Read dataset n of a .par file and its .fit files and map them to grid coordinates
+    header - output of indexPAR
+    length - number of grid points, common to all datasets of the file
+    engine - interpolation engine, see gridInterpolationChannels
+    threads - number of .fit files opened concurrently, see readFITs
+    Return im, tth, files, lambd, param, sub_plots, bgr - im and bgr with the frames in reverse order
+    """
+    dist, lambd, x_corr, y_corr, dataset_id, datafile_id, eta, blocks = header
+    name = dataset_id[n]
+    r, obs = readParBlocks(fname, blocks[n])
+    # Determine number of bins for the dataset
+    bins = len(obs)
+    # Open subsequent .fit files for the dataset
+    files = datafile_id[n*bins:(n+1)*bins]
+    r_cal, cal, bckg, data = readFITs(path, files, threads)
+
+    xi, yi, zi_obs, mask = gridInterpolation(r,obs,eta[n],x_corr[n],y_corr[n],dist[n],length,xi=None,yi=None,mask=None,engine=engine)
+    # calculated, background and phases share the .fit positions - interpolate them in one pass
+    channels = [cal,bckg]+[data[key] for key in data]
+    _, _, zi, _ = gridInterpolationChannels(r_cal,channels,eta[n],x_corr[n],y_corr[n],dist[n],length,xi=xi,yi=yi,mask=None,engine=engine)
+    zi_calc, zi_bgr = zi[0], zi[1]
+    zi_res = zi_obs-zi_calc 
+    sub_plots = {key:zi_sub for key, zi_sub in zip(data,zi[2:])}
+    yobs, ycal, res, bgr = zi_obs, zi_calc, zi_res, zi_bgr
+    files = ['{} η: {:5.1f} °.par'.format(name, e) for e in eta[n]]
+    
+    # (3, frames, points) - one grid row per η bin
+    im = np.array([yobs, ycal, res], dtype='float32')
+    bgr = np.array(bgr)
+    param = {} # R_p and mean intensity are derived from the statistics of the patterns
+    return im, xi, files, np.mean(lambd), param, sub_plots, bgr
+
+
+def submitParDataset(fname, path, n, header, length, engine='auto', threads=1, workers=0):
+    """Read dataset n of a .par file with readParDataset in the pool of worker processes without waiting. Return a Future"""
+    return _submit(workers, readParDataset, fname, path, n, header, length, engine, threads)
+
+
+def readFIT(fname,schema=None):  #,dist,x_corr,y_corr):
+    """
+    Read *.fit file from MAUD. 2theta values are calculated from provided detector distance. Return dictionary with tth, I, and additional columns.
+    schema - dict describing the header layout, see readXYY
+    """
+    keys = None
     with open(fname,'r') as f:
-        # Read header
-        for line in f:
-            if 'loop_' in line:
-                break  
-        for line in f:
-            if '#' in line:
-                keys.append(line.split('#')[-1].strip())
-            if not '_' in line:
-                data = np.array([line.split()],dtype='float32')
-                break
-        s = np.array([l.split() for l in f.readlines()],dtype='float32')
-        data = np.append(data,s,axis=0)
+        if schema:
+            header = [f.readline() for i in range(schema['header'])]
+            labels = header[-len(schema['labels']):]
+            if labels == schema['labels'] and 'loop_' in header[-len(labels)-1]:
+                keys = schema['keys']
+            else:
+                f.seek(0)
+        if keys is None:
+            keys = ['r','I']
+            header = []
+            labels = []
+            # Read header
+            for line in f:
+                header.append(line)
+                if 'loop_' in line:
+                    break  
+            for line in f:
+                if not '_' in line:
+                    first = line
+                    break
+                header.append(line)
+                labels.append(line)
+                if '#' in line:
+                    keys.append(line.split('#')[-1].strip())
+            if schema == {}:
+                schema.update(header=len(header),labels=labels,keys=keys)
+        else:
+            first = ''
+        data = parseNumeric(first+f.read(),dtype='float32')
         if data[0,0]>data[1,0]:
             data = np.flipud(data)
     dic = {k:data[:,i] for i,k in enumerate(keys)}        
@@ -218,13 +449,18 @@ def readFIT(fname):  #,dist,x_corr,y_corr):
 
 
 def readCSV(fname):
-    c = np.loadtxt(fname,dtype='float32',delimiter=',')
+    with open(fname,'r') as f:
+        c = parseNumeric(f.read().replace(',',' '),dtype='float32')
     tth = c[0]
-    im = np.rot90(c[1:,:],k=-1)
+    im = c[1:,:]
     return tth, im
 
 
-def readDAT(fname,temp=None,lamb=None,ts=None,t=None):      
+def readDAT(fname,temp=None,lamb=None,ts=None,t=None,schema=None):
+    """Read [2θ, I, σ] .dat file with a six line header, or the start, step, stop format (see readDatAlt)"""
+    if schema and schema['alt']:
+        tth, I, _ = readDatAlt(fname)
+        return tth,I,temp,lamb,ts,t
     with open(fname,'r') as file:
         for i in range(6):
             line = file.readline()
@@ -238,9 +474,13 @@ def readDAT(fname,temp=None,lamb=None,ts=None,t=None):
                 t = float(line.split()[-3])*float(line.split()[-1])
             if i == 3 and len(line.split())>=10:
                 #If alternativ .dat format:
+                if schema == {}:
+                    schema['alt'] = True
                 tth, I, _ = readDatAlt(fname)
                 return tth,I,temp,lamb,ts,t 
-        content = np.loadtxt(file, skiprows = 0)
+        if schema == {}:
+            schema['alt'] = False
+        content = parseNumeric(file.read())
     tth, I = content[:,0], content[:,1]
     return tth,I,temp,lamb,ts,t
 
@@ -253,20 +493,107 @@ def readDatAlt(fname):
         start,step,stop = [float(x) for x in file.readline().split()[0:3]]
         content = file.read()
     tth = np.arange(start,stop+step,step)
-    I = content.split()[:len(tth)]
-    sig = content.split()[len(tth):len(tth)*2]
+    content = parseNumeric(content,0)
+    I = content[:len(tth)].astype('float32')
+    sig = content[len(tth):len(tth)*2].astype('float32')
     if len(sig)<len(tth):
-        sig = np.array(I)**0.5
-    return tth, np.array(I,dtype='float32'), np.array(sig,dtype='float32')
+        sig = I**0.5
+    return tth, I, sig
 
 
-def readXYE(fname):
+def readXYE(fname,schema=None):
     sig=None
     with open(fname,'r') as file:
-        content = np.loadtxt(file, skiprows = 0)
+        content = parseNumeric(file.read())
     if content.shape[1]<3:
         tth, I = content[:,0], content[:,1]
     else:
         tth, I, sig = content[:,0], content[:,1], content[:,2]
     return tth, I, sig
 
+
+def getWorkers(workers=0):
+    """Return the number of worker processes to use. 0 or None uses all available cores"""
+    if not workers:
+        workers = os.cpu_count() or 1
+    return max(int(workers),1)
+
+
+def _readChunk(reader, files):
+    """Read a list of files with reader - called in the worker processes by readFiles"""
+    return [reader(f) for f in files]
+
+
+def getExecutor(workers=0):
+    """Return the shared pool of worker processes, with at least the given number of workers"""
+    global _executor, _workers
+    workers = getWorkers(workers)
+    if _executor is None or _workers < workers:
+        if not _executor is None:
+            _executor.shutdown(wait=_SHUTDOWN_WAIT)
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _workers = workers
+    return _executor
+
+def _submit(workers, function, *args):
+    """Submit function(*args) to the shared pool of worker processes. Return a Future"""
+    global _executor
+    try:
+        future = getExecutor(workers).submit(function, *args)
+    except BrokenProcessPool:
+        # A worker died - start a new pool
+        _executor = None
+        future = getExecutor(workers).submit(function, *args)
+    _futures.add(future)
+    future.add_done_callback(_futures.discard)
+    return future
+
+def shutdownExecutor():
+    """Cancel the work waiting for the shared pool of worker processes and shut it down without waiting"""
+    global _executor
+    if not _executor is None:
+        for future in list(_futures):
+            future.cancel()
+        _executor.shutdown(wait=_SHUTDOWN_WAIT)
+        _executor = None
+
+
+def submitFiles(reader, files, workers=0):
+    """Read files in the pool of worker processes without waiting. Return a Future of the list of results"""
+    return _submit(workers, _readChunk, reader, files)
+
+
+def readFiles(reader, files, workers=0):
+    """
+    Generator yielding reader(file) for each file in files, in order.
+    Files are distributed in chunks to a pool of worker processes and read in parallel.
+    Small series, or workers=1, are read in the calling process. 
+    The layout of the first file is passed on to the reader as a schema for the rest of the series.
+    Closing the generator (e.g. when the user cancels) cancels all pending chunks.
+    """
+    global _executor
+    if len(files)<1:
+        return
+    schema = {}
+    yield reader(files[0],schema=schema)
+    reader = partial(reader,schema=schema)
+    files = files[1:]
+    workers = min(getWorkers(workers), len(files)//4)
+    if workers < 2:
+        for f in files:
+            yield reader(f)
+        return
+    # Several chunks per worker to balance the load and keep the progress bar moving
+    chunksize = int(np.clip(len(files)//(workers*4),1,64))
+    futures = [_submit(workers, _readChunk, reader, files[i:i+chunksize]) for i in range(0,len(files),chunksize)]
+    try:
+        for future in futures:
+            for result in future.result():
+                yield result
+    except BrokenProcessPool:
+        # A worker died - start a new pool next time
+        _executor = None
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
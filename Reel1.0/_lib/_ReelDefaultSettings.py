@@ -5,6 +5,17 @@ Default settings for Reel - DO NOT MODIFY
 # General
 work_directory = r''
 default_file_extension = '*.xyy'  # '*.xyy, *.prf, *.par, *.dat, *.xye *.xy, *.csv'  
+loader_workers = 0 # Number of processes used to read files - 0: all available cores, 1: read in the main process
+cache_directory = r'' # Folder for cached copies of opened datasets - empty: "_cache" in the program folder
+cache_size_limit = 2000 # MB - 0: disable the cache
+watch_interval = 250 # ms - Time between checks for new files when watching a folder
+progressive_interval = 500 # ms - Time between updates of a dataset while its files are read - 0: show the dataset when all files are read
+par_interpolation = 'auto' # .par files - 'rows': 1D interpolation of each eta sector, 'griddata': 2D interpolation across sectors, 'auto': 'rows' if the sectors are evenly spaced
+fit_threads = 8 # .par files - Number of .fit files opened concurrently - 1: one at a time
+out_of_core_directory = r'' # Folder for memory-mapped copies of opened datasets, for datasets larger than the available memory - empty: keep datasets in memory
+out_of_core_surface_rows = 4000 # Maximum number of frames drawn in the surface plots of memory-mapped datasets - every n'th frame is drawn
+display_cache_size = 500 # MB - Memory for the scaled surface images and parameter plots of the datasets, kept for switching scale, background and dataset - 0: disable
+memory_budget = 0 # MB - Memory for the patterns of the open datasets - the least recently shown datasets are moved to temporary memory-mapped files (in out_of_core_directory if set) when it is exceeded - 0: no limit
 
 # Manual wavelength
 default_wavelength = 1.7902 # Å
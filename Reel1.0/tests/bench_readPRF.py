@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of reading FullProf .prf files - readPRF and the Yobs-Ycal residual of openPRF - against the previous
+line by line implementation, on _test_files/prf and a synthetic series of 100 files with 10240 points.
+Run from the Reel1.0 folder: python tests/bench_readPRF.py
+"""
+import os
+import sys
+import glob
+import time
+import tempfile
+import numpy as np
+
+REEL = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REEL)
+os.chdir(REEL)
+from _lib.ReelRead import readPRF
+
+def readPRFLines(fname):
+    """The previous readPRF, splitting each line and combining the excluded regions in a loop"""
+    header = []
+    mask = [] #Excluded region
+    content = []
+    with open(fname) as file:
+        for i in range(3):
+            header.append(file.readline())
+        try:
+            temp = float(header[0].split()[-1])
+        except ValueError:
+            temp = None
+        lambd =  [float(l) for l in header[1].split()[2:4]]
+        for i in range(int(header[2].split()[-1])):
+            mask.append(file.readline().split())
+        file.readline()
+        for i in range(int(header[1].split()[1])):
+            content.append(file.readline().split()[0:5])
+    content = np.array(content, dtype='float32')
+    tth, yobs, ycal, res, bckg = content.T
+    mask = np.array(mask, dtype='float32')
+    if len(mask)>0:
+        excl_reg = (tth < mask[0,0]) | (tth > mask[0,1])
+    else:
+        excl_reg = np.full(tth.shape[0],True)
+    for i in mask:
+        excl_reg = ((tth < i[0]) | (tth > i[1])) & excl_reg
+    excl_reg = excl_reg==False
+    return tth, yobs, ycal, res, bckg, temp, excl_reg, lambd
+
+def previous(fname):
+    tth, yobs, ycal, res, bckg, temp, excl_reg, lambd = readPRFLines(fname)
+    res = np.array([float(yobs[i])-float(ycal[i]) for i in range(len(yobs))])
+    return tth, yobs, ycal, res, bckg, temp, excl_reg, lambd
+
+def vectorized(fname):
+    tth, yobs, ycal, res, bckg, temp, excl_reg, lambd = readPRF(fname)
+    res = yobs.astype('float64')-ycal
+    return tth, yobs, ycal, res, bckg, temp, excl_reg, lambd
+
+def best(read, files, repeat):
+    """Return the shortest time in ms of reading all files with read"""
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for f in files:
+            read(f)
+        times.append(time.perf_counter()-t)
+    return min(times)*1000
+
+def synthetic(files, directory, copies=8, n=100):
+    """Write n .prf files with the data of the first of files repeated copies times along 2θ"""
+    lines = open(files[0]).read().split('\n')
+    header = lines[1].split()
+    points = int(header[1])
+    start = 3+int(lines[2].split()[-1])+1 # after the header, the excluded regions and the column names
+    data, rest = lines[start:start+points], lines[start+points:]
+    rows = []
+    for k in range(copies):
+        for line in data:
+            columns = line.split('\t')
+            columns[0] = '{:12.4f}'.format(float(columns[0])+k*128.0)
+            rows.append('\t'.join(columns))
+    header[1] = str(len(rows))
+    head = lines[:start]
+    head[1] = '  '+'   '.join(header)
+    text = '\n'.join(head+rows+rest)
+    for i in range(n):
+        with open(os.path.join(directory,'s_{:04d}.prf'.format(i)),'w') as file:
+            file.write(text)
+    return sorted(glob.glob(os.path.join(directory,'*.prf'))), len(rows)
+
+def main():
+    files = sorted(glob.glob(os.path.join('_test_files','prf','*.prf')))
+    with tempfile.TemporaryDirectory() as directory:
+        big, points = synthetic(files,directory)
+        for name, series, repeat in (('_test_files/prf ({} x {} points)'.format(len(files),readPRF(files[0])[0].shape[0]),files,7),
+                                     ('synthetic {} x {} points'.format(len(big),points),big,3)):
+            for f in series[:3]:
+                for a, b in zip(previous(f),vectorized(f)):
+                    assert np.array_equal(a,b,equal_nan=True) if isinstance(a,np.ndarray) else a == b, f
+            print('{:40s} {:8.1f} ms -> {:8.1f} ms'.format(name,best(previous,series,repeat),best(vectorized,series,repeat)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Run the tests from the Reel1.0 folder, as Reel itself is run, without a display
+"""
+import os
+import sys
+
+REEL = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REEL)
+os.chdir(REEL)
+os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from _lib.ReelDataset import PatternStatistics
+
+def frames(seed, n, points=200):
+    rng = np.random.default_rng(seed)
+    obs = rng.normal(10,5,(n,points)).astype('float32') # includes values <= 0, left out of the per point sums
+    obs[rng.random((n,points))<0.05] = np.nan
+    res = rng.normal(0,1,(n,points)).astype('float32')
+    return obs, res
+
+def accumulate(obs, res, include):
+    statistics = PatternStatistics(*obs.shape)
+    for i in range(obs.shape[0]):
+        statistics.add(i,obs[i],res[i],include)
+    return statistics
+
+def assertEqualStatistics(a, b):
+    for name in PatternStatistics.__slots__:
+        assert np.allclose(getattr(a,name),getattr(b,name),equal_nan=True), name
+
+def test_add_with_include_matches_fromFrames():
+    obs, res = frames(0,30)
+    include = np.arange(obs.shape[1])%7 != 0
+    statistics = accumulate(obs,res,include)
+    reference = PatternStatistics.fromFrames(obs,res)
+    for name in PatternStatistics.__slots__:
+        if not name in ('r_obs', 'r_res'):
+            assert np.allclose(getattr(statistics,name),getattr(reference,name),equal_nan=True), name
+    assert np.allclose(statistics.r_obs,np.nansum(np.where(include,obs,0),axis=1))
+    assert np.allclose(statistics.r_res,np.nansum(np.abs(np.where(include,res,0)),axis=1))
+
+def test_splice_with_include_matches_fresh_statistics():
+    obs, res = frames(1,30)
+    include = np.arange(obs.shape[1])%7 != 0
+    statistics = accumulate(obs,res,include)
+    # frames 3 and 10 are modified and 5 new frames are appended
+    changed = [3,10]
+    new_obs, new_res = frames(2,len(changed)+5)
+    spliced = statistics.splice(changed,accumulate(new_obs,new_res,include),obs[changed])
+    obs[changed], res[changed] = new_obs[:2], new_res[:2]
+    obs, res = np.concatenate((obs,new_obs[2:])), np.concatenate((res,new_res[2:]))
+    assertEqualStatistics(spliced,accumulate(obs,res,include))
+    reference = PatternStatistics.fromFrames(obs,res)
+    for name in PatternStatistics.POINT_FIELDS:
+        assert np.allclose(getattr(spliced,name),getattr(reference,name)), name
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from _lib.ReelMisc import appendFrames, decimationPyramid
+
+def test_appendFrames_grows_in_place():
+    rng = np.random.default_rng(0)
+    a = rng.random((3,50),dtype='float32')
+    expected = a.copy()
+    buffers = set()
+    for n in (1,2,5,1,40,3):
+        b = rng.random((n,50),dtype='float32')
+        previous = a
+        a = appendFrames(a,b)
+        expected = np.concatenate((expected,b))
+        assert np.array_equal(a,expected)
+        # the frames before the append are not changed by it
+        assert np.array_equal(previous,expected[:previous.shape[0]])
+        buffers.add(a.__array_interface__['data'][0])
+    # spare capacity is doubled, so only a few buffers are allocated
+    assert len(buffers) <= 4
+
+def test_decimationPyramid_extends_previous_pyramid():
+    rng = np.random.default_rng(1)
+    for columns in (300, 1151):
+        a = rng.random((5,columns),dtype='float32')
+        levels = decimationPyramid(a)
+        for n in (1,3,250,1,300,10,10,900):
+            a = appendFrames(a,rng.random((n,columns),dtype='float32'))
+            levels = decimationPyramid(a,previous=levels)
+            reference = decimationPyramid(np.array(a))
+            assert [level.shape for level in levels] == [level.shape for level in reference]
+            assert all(np.array_equal(level,r) for level, r in zip(levels,reference))
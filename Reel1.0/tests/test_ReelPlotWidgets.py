@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from PyQt5 import QtCore, QtWidgets
+
+from _lib.ReelPlotWidgets import MultiImageWidget
+
+@pytest.fixture(scope='module')
+def widget():
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    w = MultiImageWidget(n_images=3,labels=('Observed','Calculated','Scale','Residual','Scale'))
+    w.resize(1200,600)
+    w.show()
+    app.processEvents()
+    yield w
+    w.close()
+
+def imageRect(w, index):
+    image = w.images[index]
+    return image.mapRectToParent(image.boundingRect())
+
+def test_level_covers_full_image(widget):
+    im = np.random.default_rng(0).random((5000,3000),dtype='float32')
+    widget.setData(0,im)
+    QtWidgets.QApplication.processEvents()
+    k, (y0,y1), (x0,x1) = widget._shown[0]
+    assert k > 0
+    # the whole of a coarse version covers the same data coordinates as the full image
+    assert (y0,y1,x0,x1) == (0,widget._levels[0][k].shape[0],0,widget._levels[0][k].shape[1])
+    assert imageRect(widget,0) == QtCore.QRectF(0,0.5,3000,5000)
+    assert widget.outlines[0].rect() == QtCore.QRectF(0,0.5,3000,5000)
+
+def test_cropped_level_keeps_frame_coordinates(widget):
+    im = np.random.default_rng(1).random((5000,3000),dtype='float32')
+    widget.setData(0,im)
+    widget.views[0].setRange(xRange=[1000,1100],yRange=[2000,2100],padding=0)
+    QtWidgets.QApplication.processEvents()
+    k, (y0,y1), (x0,x1) = widget._shown[0]
+    assert k == 0
+    # frame j is drawn from j+0.5 to j+1.5, as in the uncropped image
+    assert imageRect(widget,0) == QtCore.QRectF(x0,y0+0.5,x1-x0,y1-y0)
+    assert np.array_equal(widget.images[0].image,im[y0:y1,x0:x1])
+
+def test_stretched_level_keeps_frame_coordinates(widget):
+    im = np.random.default_rng(2).random((1000,3000),dtype='float32')
+    widget.setData(0,im,rows=4000)
+    widget.views[0].setRange(xRange=[0,3000],yRange=[1000,3000],padding=0)
+    QtWidgets.QApplication.processEvents()
+    k, (y0,y1), (x0,x1) = widget._shown[0]
+    rows, cols = widget._levels[0][k].shape
+    rect = imageRect(widget,0)
+    assert rect.top() == pytest.approx(0.5+y0*4000/rows)
+    assert rect.height() == pytest.approx((y1-y0)*4000/rows)
+    assert rect.left() == pytest.approx(x0*3000/cols)